@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import sys
+from typing import Iterable
+
+import numpy as np
+from google.cloud import bigquery
+
+PROJECT_ID          = os.environ.get("GOOGLE_CLOUD_PROJECT")
+DATASET_ID          = "ads_dataset"
+SOURCE_TABLES       = ("faqs_embedded", "documents_embedded")
+INDEX_PATH          = "artifacts/ann_index.npz"
+
+FRACTION_LISTS_TO_SEARCH = 0.1
+MIN_LISTS_TO_SEARCH = 8          # small indexes have few lists; one probed list loses too much recall
+EXACT_SEARCH_BELOW  = 5000       # below this many vectors scanning every list is cheap
+TRAIN_SAMPLE        = 100_000
+KMEANS_ITERATIONS   = 20
+PQ_CENTROIDS        = 256
+ASSIGN_BATCH        = 16384
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the L2-nearest centroid for each row, in batches to bound memory."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), ASSIGN_BATCH):
+        batch = x[start:start + ASSIGN_BATCH]
+        assign[start:start + ASSIGN_BATCH] = np.argmin(centroid_norms - 2 * batch @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind="stable")
+        nonempty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = np.add.reduceat(x[order], starts, axis=0) / counts[nonempty, None]
+        # Re-seed empty clusters from random points so every list gets used.
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force top-k ids by cosine similarity, the baseline ANN results are scored against."""
+    scores = _normalize(queries) @ _normalize(vectors).T
+    top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-normalized embeddings, searched by cosine similarity.
+
+    Vectors are bucketed by their nearest of nlist k-means centroids; a query scans
+    only the lists of its closest centroids, chosen by fraction_lists_to_search just
+    like BigQuery's IVF option. With pq_subvectors=0 lists hold float16 vectors
+    (IVF-Flat); otherwise residuals are product-quantized to one byte per subvector
+    (IVF-PQ), trading some recall for roughly 2*dim/pq_subvectors times less memory.
+
+    Inserts append to per-list segments that are merged lazily; deletes are
+    tombstones filtered at query time until compact() rewrites the lists.
+    """
+
+    def __init__(self, dim: int, nlist: int, pq_subvectors: int = 0, seed: int = 0):
+        if pq_subvectors and dim % pq_subvectors:
+            raise ValueError(f"dim {dim} is not divisible into {pq_subvectors} subvectors")
+        self.dim = dim
+        self.nlist = nlist
+        self.pq_subvectors = pq_subvectors
+        self.seed = seed
+        self.centroids = None
+        self.codebooks = None
+        self._segments = [[] for _ in range(nlist)]
+        self._deleted = set()
+        self._deleted_array = np.empty(0, dtype=np.int64)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return sum(len(ids) for segments in self._segments for ids, _ in segments) - len(self._deleted)
+
+    def train(self, vectors: np.ndarray, iterations: int = KMEANS_ITERATIONS):
+        rng = np.random.default_rng(self.seed)
+        x = _normalize(vectors)
+        if len(x) > TRAIN_SAMPLE:
+            x = x[rng.choice(len(x), TRAIN_SAMPLE, replace=False)]
+        self.centroids = _kmeans(x, self.nlist, iterations, rng)
+        self.nlist = len(self.centroids)
+        self._segments = [[] for _ in range(self.nlist)]
+        if self.pq_subvectors:
+            residuals = x - self.centroids[_nearest(x, self.centroids)]
+            sub_dim = self.dim // self.pq_subvectors
+            self.codebooks = np.stack([
+                _kmeans(residuals[:, m * sub_dim:(m + 1) * sub_dim], PQ_CENTROIDS, iterations, rng)
+                for m in range(self.pq_subvectors)
+            ])
+
+    def _encode(self, x: np.ndarray, assign: np.ndarray) -> np.ndarray:
+        if not self.pq_subvectors:
+            return x.astype(np.float16)
+        residuals = x - self.centroids[assign]
+        sub_dim = self.dim // self.pq_subvectors
+        codes = np.empty((len(x), self.pq_subvectors), dtype=np.uint8)
+        for m in range(self.pq_subvectors):
+            codes[:, m] = _nearest(residuals[:, m * sub_dim:(m + 1) * sub_dim], self.codebooks[m])
+        return codes
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray):
+        if not self.is_trained:
+            raise RuntimeError("index must be trained before adding vectors")
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._deleted and np.isin(ids, self._deleted_array).any():
+            # Re-inserting a deleted id: drop its tombstoned copy first.
+            self.compact()
+        x = _normalize(vectors)
+        assign = _nearest(x, self.centroids)
+        data = self._encode(x, assign)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=self.nlist)
+        start = 0
+        for list_no in np.flatnonzero(counts):
+            rows = order[start:start + counts[list_no]]
+            start += counts[list_no]
+            self._segments[list_no].append((ids[rows], data[rows]))
+
+    def remove(self, ids: Iterable[int]):
+        # Only tombstone ids actually stored, so len() (and the exact-search cutoff) stays right.
+        ids = np.unique(np.fromiter((int(i) for i in ids), dtype=np.int64))
+        ids = ids[~np.isin(ids, self._deleted_array)]
+        present = np.zeros(len(ids), dtype=bool)
+        for list_no in range(self.nlist):
+            present |= np.isin(ids, self._list(list_no)[0])
+        self._deleted.update(ids[present].tolist())
+        self._deleted_array = np.fromiter(self._deleted, dtype=np.int64)
+
+    def compact(self):
+        for list_no in range(self.nlist):
+            ids, data = self._list(list_no)
+            if len(ids) and self._deleted:
+                keep = ~np.isin(ids, self._deleted_array)
+                self._segments[list_no] = [(ids[keep], data[keep])]
+        self._deleted = set()
+        self._deleted_array = np.empty(0, dtype=np.int64)
+
+    def _list(self, list_no: int) -> tuple[np.ndarray, np.ndarray]:
+        segments = self._segments[list_no]
+        if not segments:
+            width = self.pq_subvectors or self.dim
+            return np.empty(0, dtype=np.int64), np.empty((0, width), dtype=np.uint8 if self.pq_subvectors else np.float16)
+        if len(segments) > 1:
+            segments[:] = [(np.concatenate([s[0] for s in segments]), np.concatenate([s[1] for s in segments]))]
+        return segments[0]
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        fraction_lists_to_search: float = FRACTION_LISTS_TO_SEARCH,
+        nprobe: int | None = None,
+        min_lists_to_search: int = MIN_LISTS_TO_SEARCH,
+        exact_below: int = EXACT_SEARCH_BELOW,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (ids, cosine scores) of the approximate top-k, best first."""
+        q = _normalize(query)
+        if len(self) < exact_below:
+            nprobe = self.nlist
+        nprobe = min(nprobe or max(min_lists_to_search, round(fraction_lists_to_search * self.nlist)), self.nlist)
+        centroid_scores = self.centroids @ q
+        probe = np.argpartition(-centroid_scores, min(nprobe, self.nlist) - 1)[:nprobe]
+
+        if self.pq_subvectors:
+            sub_dim = self.dim // self.pq_subvectors
+            # Asymmetric distance: per-subvector lookup tables of <q, codeword>.
+            tables = np.einsum("mcd,md->mc", self.codebooks, q.reshape(self.pq_subvectors, sub_dim))
+            subvector = np.arange(self.pq_subvectors)
+
+        all_ids = []
+        all_scores = []
+        for list_no in probe:
+            ids, data = self._list(list_no)
+            if not len(ids):
+                continue
+            if self.pq_subvectors:
+                scores = centroid_scores[list_no] + tables[subvector, data.astype(np.intp)].sum(axis=1)
+            else:
+                scores = data.astype(np.float32) @ q
+            all_ids.append(ids)
+            all_scores.append(scores)
+        if not all_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        if self._deleted:
+            alive = ~np.isin(ids, self._deleted_array)
+            ids, scores = ids[alive], scores[alive]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return ids[order], scores[order]
+
+    def memory_bytes(self) -> int:
+        total = self.centroids.nbytes if self.is_trained else 0
+        if self.codebooks is not None:
+            total += self.codebooks.nbytes
+        for segments in self._segments:
+            total += sum(ids.nbytes + data.nbytes for ids, data in segments)
+        return total
+
+    def save(self, path: str, records: list[dict] | None = None):
+        lists = [self._list(list_no) for list_no in range(self.nlist)]
+        metadata = {"dim": self.dim, "nlist": self.nlist, "pq_subvectors": self.pq_subvectors, "seed": self.seed, "records": records}
+        np.savez(
+            path,
+            metadata=np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+            centroids=self.centroids,
+            codebooks=self.codebooks if self.codebooks is not None else np.empty(0, dtype=np.float32),
+            list_sizes=np.array([len(ids) for ids, _ in lists], dtype=np.int64),
+            ids=np.concatenate([ids for ids, _ in lists]),
+            data=np.concatenate([data for _, data in lists]),
+            deleted=self._deleted_array,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> tuple["IVFIndex", list[dict] | None]:
+        with np.load(path) as saved:
+            metadata = json.loads(saved["metadata"].tobytes())
+            index = cls(metadata["dim"], metadata["nlist"], metadata["pq_subvectors"], metadata["seed"])
+            index.centroids = saved["centroids"]
+            index.codebooks = saved["codebooks"] if saved["codebooks"].size else None
+            ids, data = saved["ids"], saved["data"]
+            offsets = np.concatenate([[0], np.cumsum(saved["list_sizes"])])
+            index._segments = [
+                [(ids[offsets[i]:offsets[i + 1]], data[offsets[i]:offsets[i + 1]])] if offsets[i + 1] > offsets[i] else []
+                for i in range(index.nlist)
+            ]
+            index.remove(saved["deleted"].tolist())
+        return index, metadata["records"]
+
+
+def default_nlist(num_vectors: int) -> int:
+    # Usual IVF rule of thumb: about sqrt(n) lists.
+    return max(1, min(int(np.sqrt(num_vectors)), 65536))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a local ANN index over the retrieval tables")
+    parser.add_argument("--output", default=INDEX_PATH)
+    parser.add_argument("--nlist", type=int, default=0, help="number of IVF lists (default: sqrt of row count)")
+    parser.add_argument("--pq-subvectors", type=int, default=0, help="product-quantize into this many bytes per vector (0 = float16 vectors)")
+    args = parser.parse_args()
+
+    try:
+        client = bigquery.Client(project=PROJECT_ID)
+        records = []
+        embeddings = []
+        for table in SOURCE_TABLES:
+            query = f"SELECT question, answer, ml_generate_embedding_result FROM `{PROJECT_ID}.{DATASET_ID}.{table}`"
+            try:
+                rows = client.query(query).result(page_size=10000)
+            except Exception as e:
+                print(f"Skipping {table}: {e}")
+                continue
+            for row in rows:
+                records.append({"question": row.question, "answer": row.answer, "table": table})
+                embeddings.append(np.asarray(row.ml_generate_embedding_result, dtype=np.float32))
+            print(f"✓ Read {len(records)} rows through {table}")
+
+        vectors = np.stack(embeddings)
+        del embeddings
+        index = IVFIndex(vectors.shape[1], args.nlist or default_nlist(len(vectors)), args.pq_subvectors)
+        index.train(vectors)
+        index.add(np.arange(len(vectors)), vectors)
+        index.save(args.output, records)
+        print(f"✓ Saved {len(index)} vectors in {index.nlist} lists to {args.output} ({index.memory_bytes() / 1024 / 1024:.1f} MiB)")
+
+    except Exception as e:
+        print(f"Error building ANN index: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
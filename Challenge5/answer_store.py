@@ -0,0 +1,79 @@
+import hashlib
+import json
+import re
+
+import numpy as np
+
+MATCH_THRESHOLD = 0.92
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+
+def faq_version(rows: list[tuple[str, str]]) -> str:
+    """Content hash of the FAQ table, so a store is only served against the rows it was built from."""
+    digest = hashlib.sha256()
+    for question, answer in sorted(rows):
+        digest.update(question.encode())
+        digest.update(b"\0")
+        digest.update(answer.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class AnswerStore:
+    """
+    Precomputed answers keyed by normalized question text, plus a unit-norm
+    embedding matrix for near-duplicate matching (float16 on disk, float32 in memory
+    since numpy has no fast float16 matmul). Exact-key hits are a dict lookup;
+    embedding hits are one matrix-vector product over the stored questions.
+    """
+
+    def __init__(self, version: str, records: list[dict], embeddings: np.ndarray | None = None):
+        self.version = version
+        self.records = records
+        self._keys = {normalize(r["question"]): i for i, r in enumerate(records)}
+        self.embeddings = None
+        if embeddings is not None and len(embeddings):
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self.embeddings = embeddings / np.maximum(norms, 1e-12)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def lookup(self, query: str, embedding: list[float] | None = None, threshold: float = MATCH_THRESHOLD) -> dict | None:
+        index = self._keys.get(normalize(query))
+        if index is not None:
+            return self.records[index]
+        if embedding is None or self.embeddings is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(np.linalg.norm(vector), 1e-12)
+        scores = self.embeddings @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self.records[best]
+        return None
+
+    def save(self, path: str):
+        metadata = json.dumps({"version": self.version, "records": self.records}).encode()
+        np.savez_compressed(
+            path,
+            metadata=np.frombuffer(metadata, dtype=np.uint8),
+            embeddings=(self.embeddings if self.embeddings is not None else np.zeros((0, 0))).astype(np.float16),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "AnswerStore":
+        with np.load(path) as data:
+            metadata = json.loads(data["metadata"].tobytes())
+            embeddings = data["embeddings"]
+        store = cls(metadata["version"], metadata["records"])
+        if embeddings.size:
+            store.embeddings = embeddings.astype(np.float32)
+        return store
@@ -1,12 +1,23 @@
 import os
 import json
+import hashlib
 import logging
+import threading
+import time
+import numpy as np
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, g
 from google.cloud import bigquery
 from google.cloud import logging as cloud_logging
 from google import genai
 from google.genai import types
+from sessions import SessionStore, condense_query
+from resilience import AdmissionController, Backend, BackendUnavailable, Overloaded
+from hedging import Hedger
+from context_cache import ContextCache, UsageTracker
+from answer_store import AnswerStore, faq_version, normalize
+from cache import LocalCache, TwoTierCache, connect
+from ann_index import IVFIndex
 
 app = Flask(__name__)
 
@@ -14,6 +25,55 @@ client = genai.Client(vertexai=True, project=os.environ.get("GOOGLE_CLOUD_PROJEC
 logging_client = cloud_logging.Client()
 logger = logging_client.logger("ads-chatbot")
 bq_client = bigquery.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+MODEL_ID = os.environ.get("MODEL_ID", "gemini-2.0-flash")
+EMBEDDING_MODEL_ID = "text-embedding-005"
+PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
+DATASET_ID = "ads_dataset"
+TABLE_ID = "faqs_embedded"
+DOCUMENTS_TABLE_ID = "documents_embedded"
+# Also retrieve over document chunks loaded by ingest.py
+SEARCH_DOCUMENTS = os.environ.get("SEARCH_DOCUMENTS", "false").lower() == "true"
+
+session_store = SessionStore(max_sessions=int(os.environ.get("MAX_SESSIONS", 10000)))
+
+SEARCH_DEADLINE_SECONDS = float(os.environ.get("SEARCH_DEADLINE_SECONDS", 5))
+GENERATE_DEADLINE_SECONDS = float(os.environ.get("GENERATE_DEADLINE_SECONDS", 20))
+
+bigquery_backend = Backend("bigquery", deadline=SEARCH_DEADLINE_SECONDS)
+gemini_backend = Backend("gemini", deadline=GENERATE_DEADLINE_SECONDS)
+embedding_backend = Backend("embedding", deadline=float(os.environ.get("EMBED_DEADLINE_SECONDS", 2)))
+
+# L1 per instance, L2 shared across instances when REDIS_URL points at Memorystore / Redis
+shared_cache = connect(os.environ.get("REDIS_URL"))
+# Embeddings are cached as packed float32 bytes (~3 KB each for 768 dims, vs ~25 KB as a list of floats)
+embedding_cache = TwoTierCache(
+    "ads:emb:f32",
+    shared_cache,
+    ttl=7 * 24 * 3600,
+    l1=LocalCache(max_items=int(os.environ.get("EMBEDDING_CACHE_ITEMS", 5000))),
+)
+
+# gunicorn runs 16 threads, more than 6 in flight + 2 waiting, so excess chats reach Flask and get a fast 503
+# instead of queueing in gunicorn (Cloud Run --concurrency matches the thread count)
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get("CHAT_MAX_CONCURRENT", 6)),
+    max_queue=int(os.environ.get("CHAT_MAX_QUEUE", 2)),
+    queue_timeout=float(os.environ.get("CHAT_QUEUE_TIMEOUT_SECONDS", 2)),
+)
+
+# Optional hedging: duplicate slow Gemini calls, optionally to another region or a faster model
+hedger = None
+if os.environ.get("HEDGE_ENABLED", "false").lower() == "true":
+    hedger = Hedger(
+        delay_percentile=float(os.environ.get("HEDGE_DELAY_PERCENTILE", 95)),
+        budget_ratio=float(os.environ.get("HEDGE_BUDGET_RATIO", 0.05)),
+    )
+    hedge_client = genai.Client(
+        vertexai=True,
+        project=os.environ.get("GOOGLE_CLOUD_PROJECT"),
+        location=os.environ.get("HEDGE_LOCATION", "us-central1"),
+    )
+    HEDGE_MODEL_ID = os.environ.get("HEDGE_MODEL_ID", MODEL_ID)
 
 SYSTEM_INSTRUCTION = """You are a helpful assistant for the Alaska Department of Snow (ADS).
 Your role is to answer questions about ADS services, snow removal, road conditions, and related topics.
@@ -47,6 +107,126 @@ SAFETY_SETTINGS = [
     ),
 ]
 
+GENERATION_ERROR_RESPONSE = "I apologize, but I encountered an error. Please try again later."
+DEGRADED_RESPONSE_PREFIX = "Here is the closest answer from the ADS FAQ:"
+
+def load_faq_rows() -> list[tuple[str, str]]:
+    query = f"SELECT question, answer FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`"
+    return [(row.question, row.answer) for row in bq_client.query(query).result()]
+
+def load_faq_corpus() -> str:
+    corpus = "ADS FAQ DATABASE:\n\n"
+    for question, answer in load_faq_rows():
+        corpus += f"Q: {question}\nA: {answer}\n\n"
+    return corpus
+
+# Cache the system instruction (and with CONTEXT_CACHE_FAQS=true the full FAQ corpus, replacing retrieval)
+context_cache = None
+if os.environ.get("CONTEXT_CACHE_ENABLED", "false").lower() == "true":
+    context_cache = ContextCache(
+        client,
+        MODEL_ID,
+        SYSTEM_INSTRUCTION,
+        contents_loader=load_faq_corpus if os.environ.get("CONTEXT_CACHE_FAQS", "false").lower() == "true" else None,
+        ttl_seconds=int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600)),
+    )
+usage_tracker = UsageTracker()
+
+def load_answer_store(path: str) -> AnswerStore | None:
+    try:
+        store = AnswerStore.load(path)
+        current_version = faq_version(load_faq_rows())
+        if store.version != current_version:
+            print(f"Answer store {store.version} is stale (FAQ table is {current_version}), not serving it")
+            return None
+        print(f"Serving {len(store)} precomputed answers from {path}")
+        return store
+    except Exception as e:
+        print(f"Error loading answer store: {e}")
+        return None
+
+# Precomputed answers built by precompute_answers.py; only served while they match the FAQ table
+answer_store = load_answer_store(os.environ["ANSWER_STORE_PATH"]) if os.environ.get("ANSWER_STORE_PATH") else None
+ANSWER_STORE_EMBED_MATCH = os.environ.get("ANSWER_STORE_EMBED_MATCH", "false").lower() == "true"
+
+def load_ann_index(path: str) -> tuple[IVFIndex | None, list[dict] | None]:
+    try:
+        index, records = IVFIndex.load(path)
+        if not SEARCH_DOCUMENTS:
+            # Same rows as BigQuery VECTOR_SEARCH: drop document chunks from the search
+            index.remove([i for i, record in enumerate(records) if record.get("table") == DOCUMENTS_TABLE_ID])
+            index.compact()
+        print(f"Searching {len(index)} vectors in {index.nlist} lists from {path}")
+        return index, records
+    except Exception as e:
+        print(f"Error loading ANN index, using BigQuery VECTOR_SEARCH: {e}")
+        return None, None
+
+# Local ANN index built by ann_index.py; replaces BigQuery VECTOR_SEARCH when present
+ann_index, ann_records = load_ann_index(os.environ["ANN_INDEX_PATH"]) if os.environ.get("ANN_INDEX_PATH") else (None, None)
+ANN_FRACTION_LISTS_TO_SEARCH = float(os.environ.get("ANN_FRACTION_LISTS_TO_SEARCH", 0.1))
+
+def table_modified(table_id: str) -> str:
+    # Table metadata only: no query job, and bounded like any other BigQuery call
+    table = bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{table_id}", timeout=SEARCH_DEADLINE_SECONDS)
+    return f"{table.modified.timestamp():.0f}"
+
+def retrieval_version() -> str:
+    """Identifies the data retrieval runs against: FAQ table, document table and ANN index."""
+    parts = [table_modified(TABLE_ID), "docs" if SEARCH_DOCUMENTS else "faqs"]
+    if SEARCH_DOCUMENTS:
+        parts.append(table_modified(DOCUMENTS_TABLE_ID))
+    if ann_index:
+        path = os.environ["ANN_INDEX_PATH"]
+        parts.append(f"ann-{os.path.getsize(path)}-{os.path.getmtime(path):.0f}")
+    return hashlib.sha1(":".join(parts).encode()).hexdigest()[:12]
+
+def load_retrieval_version() -> str:
+    try:
+        return retrieval_version()
+    except Exception as e:
+        print(f"Error reading retrieval version, scoping caches to this revision: {e}")
+        return os.environ.get("K_REVISION", "local")
+
+# Retrieval results and answers are namespaced by that version, so reloading the FAQ table or switching
+# retrieval sources never serves entries computed against the old data from the shared cache
+RETRIEVAL_VERSION = load_retrieval_version()
+RETRIEVAL_VERSION_CHECK_SECONDS = float(os.environ.get("RETRIEVAL_VERSION_CHECK_SECONDS", 300))
+retrieval_cache = TwoTierCache(f"ads:faqs:{RETRIEVAL_VERSION}", shared_cache, ttl=3600)
+answer_cache = TwoTierCache(f"ads:answer:{RETRIEVAL_VERSION}", shared_cache, ttl=3600)
+
+def check_retrieval_version():
+    global RETRIEVAL_VERSION, answer_store
+    try:
+        version = retrieval_version()
+    except Exception as e:
+        print(f"Error checking retrieval version, keeping {RETRIEVAL_VERSION}: {e}")
+        return
+    if version != RETRIEVAL_VERSION:
+        print(f"Retrieval data changed ({RETRIEVAL_VERSION} -> {version}), switching cache namespaces")
+        RETRIEVAL_VERSION = version
+        retrieval_cache.namespace = f"ads:faqs:{version}"
+        answer_cache.namespace = f"ads:answer:{version}"
+        if context_cache and context_cache.includes_corpus:
+            # The cached corpus is a snapshot of the FAQ table; rebuild it from the new rows.
+            context_cache.refresh()
+        if answer_store:
+            try:
+                current_version = faq_version(load_faq_rows())
+            except Exception as e:
+                print(f"Error reading FAQ table, not serving precomputed answers: {e}")
+                current_version = None
+            if current_version != answer_store.version:
+                print(f"Answer store {answer_store.version} no longer matches the FAQ table, not serving it")
+                answer_store = None
+
+def watch_retrieval_version():
+    while True:
+        time.sleep(RETRIEVAL_VERSION_CHECK_SECONDS)
+        check_retrieval_version()
+
+threading.Thread(target=watch_retrieval_version, name="retrieval-version", daemon=True).start()
+
 def log_interaction(user_query: str, response: str, context: str = "", filtered: bool = False):
     log_entry = {
         "timestamp": datetime.utcnow().isoformat(),
@@ -107,46 +287,68 @@ def validate_response(response: str) -> tuple[bool, str]:
 
 def search_faqs(query: str, top_k: int = 3) -> list[dict]:
     try:
-        search_query = f"""
-        SELECT base.question, base.answer, base.content
-        FROM VECTOR_SEARCH(
-            TABLE `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`,
-            'ml_generate_embedding_result',
-            (
-                SELECT ml_generate_embedding_result, content AS query
-                FROM ML.GENERATE_EMBEDDING(
-                    MODEL `{PROJECT_ID}.{DATASET_ID}.embedding_model`,
-                    (SELECT @user_query AS content)
-                )
-            ),
-            top_k => @top_k,
-            options => '{{"fraction_lists_to_search": 0.1}}'
-        )
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_query", "STRING", query),
-                bigquery.ScalarQueryParameter("top_k", "INT64", top_k),
-            ]
-        )
-        
-        results = bq_client.query(search_query, job_config=job_config).result()
-        
-        faqs = []
-        for row in results:
-            faqs.append({
-                "question": row.question,
-                "answer": row.answer
-            })
-        
-        return faqs
-    
+        search = run_ann_search if ann_index else run_vector_search
+        return retrieval_cache.get_or_compute(f"{top_k}:{normalize(query)}", lambda: search(query, top_k), cache_if=bool)
     except Exception as e:
         print(f"Error searching FAQs: {e}")
         return []
 
-def generate_response(user_query: str, context: list[dict]) -> str:
+def run_ann_search(query: str, top_k: int) -> list[dict]:
+    embedding = embed_query(query)
+    if embedding is None:
+        raise RuntimeError("query embedding unavailable")
+    ids, _ = ann_index.search(embedding, top_k, fraction_lists_to_search=ANN_FRACTION_LISTS_TO_SEARCH)
+    return [ann_records[i] for i in ids]
+
+def run_vector_search(query: str, top_k: int) -> list[dict]:
+    base_table = f"TABLE `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`"
+    if SEARCH_DOCUMENTS:
+        base_table = f"""(
+            SELECT question, answer, content, ml_generate_embedding_result FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
+            UNION ALL
+            SELECT question, answer, content, ml_generate_embedding_result FROM `{PROJECT_ID}.{DATASET_ID}.{DOCUMENTS_TABLE_ID}`
+        )"""
+    
+    search_query = f"""
+    SELECT base.question, base.answer, base.content
+    FROM VECTOR_SEARCH(
+        {base_table},
+        'ml_generate_embedding_result',
+        (
+            SELECT ml_generate_embedding_result, content AS query
+            FROM ML.GENERATE_EMBEDDING(
+                MODEL `{PROJECT_ID}.{DATASET_ID}.embedding_model`,
+                (SELECT @user_query AS content)
+            )
+        ),
+        top_k => @top_k,
+        options => '{{"fraction_lists_to_search": 0.1}}'
+    )
+    """
+    
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("user_query", "STRING", query),
+            bigquery.ScalarQueryParameter("top_k", "INT64", top_k),
+        ]
+    )
+    
+    def run_search():
+        job = bq_client.query(search_query, job_config=job_config, timeout=SEARCH_DEADLINE_SECONDS)
+        return list(job.result(timeout=SEARCH_DEADLINE_SECONDS))
+    
+    results = bigquery_backend.call(run_search)
+    
+    faqs = []
+    for row in results:
+        faqs.append({
+            "question": row.question,
+            "answer": row.answer
+        })
+    
+    return faqs
+
+def generate_response(user_query: str, context: list[dict], summary: str = "", history: list[tuple[str, str]] | None = None) -> str:
     try:
         context_str = ""
         if context:
@@ -155,27 +357,119 @@ def generate_response(user_query: str, context: list[dict]) -> str:
                 context_str += f"Q{i}: {faq['question']}\n"
                 context_str += f"A{i}: {faq['answer']}\n\n"
         
-        prompt = f"""{context_str}
+        history_str = ""
+        if summary or history:
+            history_str = "CONVERSATION SO FAR:\n"
+            if summary:
+                history_str += f"{summary}\n"
+            for user_msg, bot_msg in history or []:
+                history_str += f"User: {user_msg}\nAssistant: {bot_msg}\n"
+        
+        prompt = f"""{context_str}{history_str}
 USER QUESTION: {user_query}
 
 Please answer the user's question based on the information provided above. If the information doesn't fully answer the question, say so and provide what help you can."""
+        
+        # Retrieval was skipped because the corpus is cached; anything sent without the cache needs it inline.
+        inline_prompt = prompt
+        if not context and context_cache and context_cache.corpus:
+            inline_prompt = f"{context_cache.corpus}\n{prompt}"
 
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_INSTRUCTION,
-                safety_settings=SAFETY_SETTINGS,
-                temperature=0.7,
-                max_output_tokens=1024,
-            )
+        inline_config = types.GenerateContentConfig(
+            system_instruction=SYSTEM_INSTRUCTION,
+            safety_settings=SAFETY_SETTINGS,
+            temperature=0.7,
+            max_output_tokens=1024,
+            http_options=types.HttpOptions(timeout=int(GENERATE_DEADLINE_SECONDS * 1000)),
         )
         
+        cache_name = context_cache.name() if context_cache else None
+        start = time.perf_counter()
+        if cache_name:
+            cached_config = inline_config.model_copy(update={"system_instruction": None, "cached_content": cache_name})
+            try:
+                response = call_gemini(prompt, cached_config, inline_prompt, inline_config)
+            except BackendUnavailable:
+                raise
+            except Exception as e:
+                print(f"Cached generation failed, retrying with inline context: {e}")
+                context_cache.invalidate()
+                cache_name = None
+                response = call_gemini(inline_prompt, inline_config, inline_prompt, inline_config)
+        else:
+            response = call_gemini(inline_prompt, inline_config, inline_prompt, inline_config)
+        usage_tracker.record(response.usage_metadata, time.perf_counter() - start, cached=bool(cache_name))
+        
         return response.text
     
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "I apologize, but I encountered an error. Please try again later."
+        if context:
+            return degraded_response(context)
+        return GENERATION_ERROR_RESPONSE
+
+def call_gemini(prompt: str, config: types.GenerateContentConfig, hedge_prompt: str, hedge_config: types.GenerateContentConfig):
+    # Caches are per region and model, so the hedge always sends its context inline.
+    if hedger is None:
+        return gemini_backend.call(client.models.generate_content, model=MODEL_ID, contents=prompt, config=config)
+    return gemini_backend.call(
+        hedger.run,
+        lambda: client.aio.models.generate_content(model=MODEL_ID, contents=prompt, config=config),
+        lambda: hedge_client.aio.models.generate_content(model=HEDGE_MODEL_ID, contents=hedge_prompt, config=hedge_config),
+        timeout=GENERATE_DEADLINE_SECONDS,
+    )
+
+def degraded_response(context: list[dict]) -> str:
+    # Used when Gemini is slow or its circuit is open: serve the best FAQ match verbatim.
+    return f"{DEGRADED_RESPONSE_PREFIX}\n\n{context[0]['answer']}"
+
+def embed_query(text: str) -> np.ndarray | None:
+    def run_embedding():
+        result = embedding_backend.call(
+            client.models.embed_content,
+            model=EMBEDDING_MODEL_ID,
+            contents=[text],
+            config=types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+        )
+        return np.asarray(result.embeddings[0].values, dtype=np.float32).tobytes()
+    
+    try:
+        return np.frombuffer(embedding_cache.get_or_compute(text, run_embedding), dtype=np.float32)
+    except Exception as e:
+        print(f"Error embedding query: {e}")
+        return None
+
+def is_cacheable_answer(result: dict) -> bool:
+    response = result["response"]
+    return (
+        validate_response(response)[0]
+        and response != GENERATION_ERROR_RESPONSE
+        and not response.startswith(DEGRADED_RESPONSE_PREFIX)
+    )
+
+def lookup_precomputed(user_query: str) -> dict | None:
+    hit = answer_store.lookup(user_query)
+    if hit is None and ANSWER_STORE_EMBED_MATCH:
+        embedding = embed_query(user_query)
+        if embedding is not None:
+            hit = answer_store.lookup(user_query, embedding)
+    return hit
+
+@app.before_request
+def admit_chat_request():
+    if request.endpoint != "chat":
+        return None
+    try:
+        admission.acquire()
+    except Overloaded:
+        busy = "We're handling a lot of questions right now. Please try again in a moment."
+        return jsonify({"response": busy, "error": True}), 503, {"Retry-After": "1"}
+    g.admitted = True
+
+@app.teardown_request
+def release_chat_request(exc):
+    if g.pop("admitted", False):
+        admission.release()
 
 @app.route("/")
 def home():
@@ -185,38 +479,69 @@ def home():
 def chat():
     """
     Main chat endpoint.
-    Implements: input validation, RAG, generation, output validation, logging
+    Implements: input validation, precomputed answers, RAG, generation, output validation, logging
     """
     try:
         data = request.get_json()
         user_query = data.get("message", "").strip()
+        session_id, summary, history = session_store.load(data.get("session_id"))
         
         # Step 1: Input validation and filtering
         is_valid, error_msg = validate_input(user_query)
         if not is_valid:
             log_interaction(user_query, error_msg, filtered=True)
-            return jsonify({"response": error_msg, "filtered": True})
+            return jsonify({"response": error_msg, "filtered": True, "session_id": session_id})
         
-        # Step 2: Search FAQs using vector search (RAG)
-        context = search_faqs(user_query)
-        context_str = json.dumps(context) if context else ""
+        # Step 2: Serve a precomputed answer when a standalone question matches a known one
+        retrieval_query = condense_query(user_query, history)
+        if answer_store and retrieval_query == user_query:
+            hit = lookup_precomputed(user_query)
+            if hit:
+                log_interaction(user_query, hit["answer"], hit["question"])
+                session_store.append_turn(session_id, user_query, hit["answer"])
+                return jsonify({
+                    "response": hit["answer"],
+                    "sources": 1,
+                    "filtered": False,
+                    "precomputed": True,
+                    "session_id": session_id
+                })
+        
+        def retrieve_and_generate() -> dict:
+            # Step 3: Search FAQs using vector search (RAG), with follow-ups made standalone
+            # (skipped when the whole FAQ corpus already sits in the context cache)
+            if context_cache and context_cache.includes_corpus and context_cache.name():
+                context = []
+            else:
+                context = search_faqs(retrieval_query)
+            
+            # Step 4: Generate response with Gemini
+            return {"response": generate_response(user_query, context, summary, history), "context": context}
         
-        # Step 3: Generate response with Gemini
-        response = generate_response(user_query, context)
+        # Answers to opening questions don't depend on a conversation, so share them across instances
+        if summary or history:
+            result = retrieve_and_generate()
+        else:
+            result = answer_cache.get_or_compute(normalize(user_query), retrieve_and_generate, cache_if=is_cacheable_answer)
+        context = result["context"]
+        context_str = json.dumps(context) if context else ""
+        response = result["response"]
         
-        # Step 4: Validate response
+        # Step 5: Validate response
         is_valid_response, cleaned_response = validate_response(response)
         if not is_valid_response:
             log_interaction(user_query, cleaned_response, context_str, filtered=True)
-            return jsonify({"response": cleaned_response, "filtered": True})
+            return jsonify({"response": cleaned_response, "filtered": True, "session_id": session_id})
         
-        # Step 5: Log the interaction
+        # Step 6: Log the interaction and remember the turn
         log_interaction(user_query, cleaned_response, context_str)
+        session_store.append_turn(session_id, user_query, cleaned_response)
         
         return jsonify({
             "response": cleaned_response,
             "sources": len(context),
-            "filtered": False
+            "filtered": False,
+            "session_id": session_id
         })
     
     except Exception as e:
@@ -232,7 +557,17 @@ def chat():
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "healthy", "service": "ADS Chatbot"})
+    return jsonify({
+        "status": "healthy",
+        "service": "ADS Chatbot",
+        "circuits": {
+            bigquery_backend.name: bigquery_backend.breaker.state,
+            gemini_backend.name: gemini_backend.breaker.state,
+        },
+        "hedging": hedger.stats() if hedger else None,
+        "retrieval_version": RETRIEVAL_VERSION,
+        "usage": usage_tracker.stats()
+    })
 
 
 HTML_TEMPLATE = """
@@ -418,6 +753,7 @@ HTML_TEMPLATE = """
         const userInput = document.getElementById('userInput');
         const sendBtn = document.getElementById('sendBtn');
         let firstMessage = true;
+        let sessionId = null;
 
         function askQuestion(question) {
             userInput.value = question;
@@ -470,10 +806,13 @@ HTML_TEMPLATE = """
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({ message: message }),
+                    body: JSON.stringify({ message: message, session_id: sessionId }),
                 });
 
                 const data = await response.json();
+                if (data.session_id) {
+                    sessionId = data.session_id;
+                }
                 
                 // Remove typing indicator
                 typingDiv.remove();
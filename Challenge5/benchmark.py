@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from ann_index import FRACTION_LISTS_TO_SEARCH, IVFIndex, default_nlist, exact_search
+from answer_store import AnswerStore
+from hedging import Hedger
+from ingest import run_pipeline
+from sessions import SessionStore
+
+SAMPLE_QUESTIONS = [
+    "How do I report an unplowed road?",
+    "What is the SnowLine app?",
+    "Does ADS handle school closures?",
+    "When does ADS plow Anchorage roads?",
+    "What about Fairbanks?",
+]
+
+SAMPLE_ANSWER = (
+    "ADS clears primary routes first, then secondary roads and residential streets. "
+    "Priority depends on traffic volume and emergency access. "
+    "You can follow plow progress in the SnowLine app or call your regional office."
+)
+
+
+def print_header(title: str):
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def bench_sessions(num_sessions: int = 10000, turns_per_session: int = 12):
+    store = SessionStore(max_sessions=num_sessions)
+    rng = random.Random(0)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(num_sessions):
+        session_id, _, _ = store.load(None)
+        for turn in range(turns_per_session):
+            # Distinct strings per turn so the measurement isn't flattered by sharing.
+            store.append_turn(session_id, f"{rng.choice(SAMPLE_QUESTIONS)} ({i}.{turn})", f"{SAMPLE_ANSWER} ({i}.{turn})")
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    prompt_sizes = []
+    for turns in (1, 4, 16, 64):
+        session_id, _, _ = store.load(None)
+        for _ in range(turns):
+            store.append_turn(session_id, rng.choice(SAMPLE_QUESTIONS), SAMPLE_ANSWER)
+        _, summary, history = store.load(session_id)
+        prompt_sizes.append((turns, len(summary) + sum(len(u) + len(b) for u, b in history)))
+
+    print_header(f"Session store: {num_sessions} sessions x {turns_per_session} turns")
+    print(f"  Total memory:       {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB)")
+    print(f"  Per 10k sessions:   {current / num_sessions * 10000 / 1024 / 1024:.1f} MiB")
+    print(f"  Per session:        {current / num_sessions / 1024:.2f} KiB")
+    print(f"  Append throughput:  {num_sessions * turns_per_session / elapsed:,.0f} turns/s")
+    print("\n  History chars sent to the prompt as conversations grow:")
+    for turns, size in prompt_sizes:
+        print(f"    {turns:>3} turns -> {size:,} chars")
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def _run_requests(num_requests: int, concurrency: int, hedger: Hedger | None, seed: int) -> list[float]:
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def stub_generate():
+        # Pareto(1.5) with a 10ms floor: p50 ~16ms but a long tail of multi-100ms calls
+        await asyncio.sleep(min(0.01 * rng.paretovariate(1.5), 2.0))
+        return "response"
+
+    async def one_request() -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            if hedger is None:
+                await stub_generate()
+            else:
+                await hedger.call(stub_generate)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one_request() for _ in range(num_requests)))
+
+
+def bench_hedging(num_requests: int = 4000, concurrency: int = 50):
+    baseline = asyncio.run(_run_requests(num_requests, concurrency, None, seed=1))
+    hedger = Hedger(delay_percentile=95, initial_delay=0.1, budget_ratio=0.05)
+    hedged = asyncio.run(_run_requests(num_requests, concurrency, hedger, seed=1))
+    stats = hedger.stats()
+
+    print_header(f"Hedged generation: {num_requests} requests against a heavy-tailed stub")
+    print(f"  {'':<10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for label, samples in (("baseline", baseline), ("hedged", hedged)):
+        print(f"  {label:<10}" + "".join(f"{percentile(samples, p) * 1000:>8.1f}ms" for p in (50, 95, 99)))
+    print(f"\n  Hedge rate:       {stats['hedge_rate']:.1%} ({stats['hedges']} hedges, {stats['hedge_wins']} won)")
+    for p in (95, 99):
+        before, after = percentile(baseline, p), percentile(hedged, p)
+        print(f"  p{p} improvement:  {(before - after) / before:.0%}")
+
+
+def bench_answer_store(num_answers: int = 2000, dim: int = 768, num_lookups: int = 20000):
+    rng = np.random.default_rng(0)
+    records = [{"question": f"Question number {i}?", "answer": SAMPLE_ANSWER, "source": "faq"} for i in range(num_answers)]
+    embeddings = rng.standard_normal((num_answers, dim)).astype(np.float32)
+    store = AnswerStore("bench", records, embeddings)
+    queries = [f"question number {i}" for i in rng.integers(0, num_answers, num_lookups)]
+    vectors = embeddings[rng.integers(0, num_answers, 1000)] + 0.1 * rng.standard_normal((1000, dim)).astype(np.float32)
+
+    start = time.perf_counter()
+    hits = sum(store.lookup(q) is not None for q in queries)
+    exact_us = (time.perf_counter() - start) / num_lookups * 1e6
+
+    start = time.perf_counter()
+    embed_hits = sum(store.lookup("unseen paraphrase", v) is not None for v in vectors)
+    embed_us = (time.perf_counter() - start) / len(vectors) * 1e6
+
+    print_header(f"Precomputed answer store: {num_answers} answers, {dim}-d embeddings")
+    print(f"  Exact-key lookup:   {exact_us:.1f} us ({hits}/{num_lookups} hits)")
+    print(f"  Embedding lookup:   {embed_us:.1f} us ({embed_hits}/{len(vectors)} hits, excludes query embedding call)")
+    print(f"  Embedding matrix:   {store.embeddings.nbytes / 1024 / 1024:.1f} MiB in memory, half that on disk")
+
+
+def _write_corpus(directory: str, total_mb: int, file_kb: int = 256):
+    rng = random.Random(0)
+    words = "snow plow road ADS route storm avalanche closure highway crew sand salt district bulletin".split()
+    for i in range(total_mb * 1024 // file_kb):
+        sentences = []
+        size = 0
+        while size < file_kb * 1024:
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 25))).capitalize() + "."
+            sentences.append(sentence)
+            size += len(sentence) + 1
+        text = " ".join(sentences)
+        if i % 4 == 0:
+            with open(os.path.join(directory, f"bulletin-{i}.html"), "w") as f:
+                f.write(f"<html><body><p>{text.replace('. ', '.</p><p>', 50)}</p></body></html>")
+        else:
+            with open(os.path.join(directory, f"manual-{i}.txt"), "w") as f:
+                f.write(text)
+
+
+def bench_ingestion(total_mb: int = 32, dim: int = 768):
+    def fake_embed(texts: list[str]) -> list[list[float]]:
+        return [[0.0] * dim for _ in texts]
+
+    written = []
+
+    def discard(rows: list[dict]):
+        written.append(len(rows))
+
+    with tempfile.TemporaryDirectory() as directory:
+        _write_corpus(directory, total_mb)
+        stats = run_pipeline([directory], fake_embed, discard)
+
+        # Second pass under tracemalloc for the parent's peak; it slows things down so isn't timed.
+        tracemalloc.start()
+        run_pipeline([directory], fake_embed, discard)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    child_peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    print_header(f"Document ingestion: {total_mb} MB local corpus, fake {dim}-d embedder")
+    print(f"  Files / chunks:     {stats['files']} / {stats['chunks']:,}")
+    print(f"  Throughput:         {stats['bytes'] / 1024 / 1024 / stats['seconds']:.1f} MB/s ({os.cpu_count()} parse workers)")
+    print(f"  Peak memory:        {peak / 1024 / 1024:.1f} MiB traced in the pipeline, {child_peak_kb / 1024:.1f} MiB max RSS per worker")
+
+
+def _synthetic_chunk(start: int, count: int, dim: int, clusters: int = 1000) -> np.ndarray:
+    """Clustered vectors, regenerated deterministically per chunk so 5M rows never sit in memory at once."""
+    centers = np.random.default_rng(0).standard_normal((clusters, dim)).astype(np.float32)
+    rng = np.random.default_rng(start + 1)
+    return centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+def bench_ann(sizes: list[int], dim: int = 128, k: int = 10, num_queries: int = 200, chunk: int = 250_000):
+    queries = _synthetic_chunk(10**12, num_queries, dim)  # seeded apart from every data chunk
+    print_header(f"ANN index vs exact search: recall@{k}, {dim}-d clustered vectors")
+    print(f"  {'vectors':>9}  {'index':<10}{'lists':>7}{'fraction':>10}{'recall':>8}{'QPS':>9}{'memory':>11}")
+
+    for n in sizes:
+        chunks = [(start, min(chunk, n - start)) for start in range(0, n, chunk)]
+
+        # Ground truth, streamed (untimed): keep a running top-k per query across chunks.
+        best_ids = np.empty((num_queries, 0), dtype=np.int64)
+        best_scores = np.empty((num_queries, 0), dtype=np.float32)
+        for offset, count in chunks:
+            vectors = _synthetic_chunk(offset, count, dim)
+            ids = exact_search(vectors, queries, k) + offset
+            normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            scores = np.take_along_axis((queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normed.T, ids - offset, axis=1)
+            merged_ids = np.concatenate([best_ids, ids], axis=1)
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            top = np.argsort(-merged_scores, axis=1)[:, :k]
+            best_ids = np.take_along_axis(merged_ids, top, axis=1)
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+
+        # Exact baseline timed like the IVF rows: normalized vectors already in memory, one query at a time.
+        matrix = np.concatenate([_synthetic_chunk(offset, count, dim) for offset, count in chunks])
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        normed_queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        start_time = time.perf_counter()
+        for q in normed_queries:
+            scores = matrix @ q
+            top = np.argpartition(-scores, k - 1)[:k]
+            ranked = top[np.argsort(-scores[top])]
+        exact_qps = num_queries / (time.perf_counter() - start_time)
+        print(f"  {n:>9,}  {'exact':<10}{'-':>7}{'-':>10}{1.0:>8.3f}{exact_qps:>9,.0f}{matrix.nbytes / 1024 / 1024:>9.1f}MB")
+        del matrix
+
+        for pq_subvectors in (0, dim // 4):
+            index = IVFIndex(dim, default_nlist(n), pq_subvectors)
+            index.train(_synthetic_chunk(0, min(n, 100_000), dim))
+            for offset, count in chunks:
+                index.add(np.arange(offset, offset + count), _synthetic_chunk(offset, count, dim))
+            index.search(queries[0], k)  # merge segments outside the timed loop
+            label = f"IVF-PQ{pq_subvectors}" if pq_subvectors else "IVF-Flat"
+            # Raw fraction sweep without the minimum-lists / small-index floors, then search() as the service calls it
+            settings = [(f"{fraction:.2f}", {"fraction_lists_to_search": fraction, "min_lists_to_search": 1, "exact_below": 0})
+                        for fraction in (0.01, 0.05, 0.1)]
+            settings.append(("serving", {"fraction_lists_to_search": FRACTION_LISTS_TO_SEARCH}))
+            for fraction_label, search_args in settings:
+                start_time = time.perf_counter()
+                results = [index.search(q, k, **search_args)[0] for q in queries]
+                qps = num_queries / (time.perf_counter() - start_time)
+                recall = np.mean([len(set(r) & set(t)) / k for r, t in zip(results, best_ids)])
+                print(f"  {n:>9,}  {label:<10}{index.nlist:>7}{fraction_label:>10}{recall:>8.3f}{qps:>9,.0f}{index.memory_bytes() / 1024 / 1024:>9.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ADS chatbot performance benchmarks")
+    parser.add_argument("--only", choices=["sessions", "hedging", "answer_store", "ingestion", "ann"], nargs="*")
+    parser.add_argument("--ann-sizes", type=int, nargs="+", default=[10_000, 100_000], help="e.g. 10000 100000 1000000 5000000")
+    parser.add_argument("--ann-dim", type=int, default=128)
+    args = parser.parse_args()
+
+    benches = {
+        "sessions": bench_sessions,
+        "hedging": bench_hedging,
+        "answer_store": bench_answer_store,
+        "ingestion": bench_ingestion,
+        "ann": lambda: bench_ann(args.ann_sizes, args.ann_dim),
+    }
+    for name, bench in benches.items():
+        if not args.only or name in args.only:
+            bench()
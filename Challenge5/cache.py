@@ -0,0 +1,211 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+import msgpack
+import redis
+
+L1_MAX_ITEMS        = 5000
+DEFAULT_TTL_SECONDS = 3600
+L2_RETRY_SECONDS    = 30
+LOCK_TTL_SECONDS    = 30
+LOCK_WAIT_SECONDS   = 10
+
+
+def encode(value: Any) -> bytes:
+    # single floats halve the size of cached embeddings
+    return msgpack.packb(value, use_bin_type=True, use_single_float=True)
+
+
+def decode(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+class LocalCache:
+    """Per-instance LRU with per-entry expiry."""
+
+    def __init__(self, max_items: int = L1_MAX_ITEMS, clock: Callable[[], float] = time.monotonic):
+        self.max_items = max_items
+        self.clock = clock
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if self.clock() >= expires_at:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._items[key] = (self.clock() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class TwoTierCache:
+    """
+    In-process L1 in front of a shared Redis-compatible L2 (e.g. Memorystore), so a
+    fresh Cloud Run instance starts warm and entries aren't recomputed per instance.
+    Values are msgpack-encoded; multi-key reads are a single MGET round trip.
+    get_or_compute collapses concurrent misses for a key into one computation, both
+    within an instance and across instances via a short-lived lock key in L2.
+    Any L2 error takes L2 out of the path for a while and the cache runs on L1 alone.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        l2: redis.Redis | None = None,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        l1: LocalCache | None = None,
+        l2_retry_after: float = L2_RETRY_SECONDS,
+        lock_ttl: float = LOCK_TTL_SECONDS,
+        lock_wait: float = LOCK_WAIT_SECONDS,
+    ):
+        self.namespace = namespace
+        self.l2 = l2
+        self.ttl = ttl
+        self.l1 = l1 or LocalCache()
+        self.l2_retry_after = l2_retry_after
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self._l2_down_until = 0.0
+        self._inflight: dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{hashlib.sha1(key.encode()).hexdigest()}"
+
+    def _l2_available(self) -> bool:
+        return self.l2 is not None and time.monotonic() >= self._l2_down_until
+
+    def _l2_failed(self, e: Exception):
+        print(f"Shared cache unavailable, using local cache only: {e}")
+        self._l2_down_until = time.monotonic() + self.l2_retry_after
+
+    def get(self, key: str) -> Any | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.l1.get(self._key(key))
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing and self._l2_available():
+            try:
+                blobs = self.l2.mget([self._key(key) for key in missing])
+            except redis.RedisError as e:
+                self._l2_failed(e)
+                return found
+            for key, blob in zip(missing, blobs):
+                if blob is not None:
+                    value = decode(blob)
+                    self.l1.set(self._key(key), value, self.ttl)
+                    found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict[str, Any], ttl: float | None = None):
+        ttl = ttl or self.ttl
+        for key, value in items.items():
+            self.l1.set(self._key(key), value, ttl)
+        if items and self._l2_available():
+            try:
+                pipe = self.l2.pipeline(transaction=False)
+                for key, value in items.items():
+                    pipe.set(self._key(key), encode(value), px=int(ttl * 1000))
+                pipe.execute()
+            except redis.RedisError as e:
+                self._l2_failed(e)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: float | None = None,
+        cache_if: Callable[[Any], bool] = lambda value: value is not None,
+    ) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        # Single flight within this instance: followers wait for the leader's result.
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait(self.lock_wait)
+            value = self.get(key)
+            if value is not None:
+                return value
+            return compute()
+
+        try:
+            value = self._compute_with_l2_lock(key, compute)
+            if cache_if(value):
+                self.set(key, value, ttl)
+            return value
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            event.set()
+
+    def _compute_with_l2_lock(self, key: str, compute: Callable[[], Any]) -> Any:
+        if not self._l2_available():
+            return compute()
+        lock_key = self._key(key) + ":lock"
+        try:
+            acquired = self.l2.set(lock_key, b"1", nx=True, px=int(self.lock_ttl * 1000))
+        except redis.RedisError as e:
+            self._l2_failed(e)
+            return compute()
+        if acquired:
+            try:
+                return compute()
+            finally:
+                try:
+                    self.l2.delete(lock_key)
+                except redis.RedisError as e:
+                    self._l2_failed(e)
+
+        # Another instance is computing: poll L2 briefly, then compute ourselves.
+        deadline = time.monotonic() + self.lock_wait
+        delay = 0.01
+        while time.monotonic() < deadline and self._l2_available():
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            value = self.get(key)
+            if value is not None:
+                return value
+            try:
+                if self.l2.get(lock_key) is None:
+                    break  # the other instance finished without caching a value
+            except redis.RedisError as e:
+                self._l2_failed(e)
+        return compute()
+
+
+def connect(url: str | None) -> redis.Redis | None:
+    if not url:
+        return None
+    # Tight timeouts: a slow shared cache must never be slower than a miss.
+    # RESP2 keeps us compatible with older Redis-protocol servers and proxies.
+    return redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1, protocol=2)
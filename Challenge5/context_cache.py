@@ -0,0 +1,184 @@
+import threading
+import time
+from typing import Callable
+
+from google.genai import types
+
+
+def _start_thread(work: Callable[[], None]):
+    threading.Thread(target=work, name="context-cache", daemon=True).start()
+
+
+class ContextCache:
+    """
+    Keeps a Gemini cached-content handle for the system instruction (and optionally
+    the whole FAQ corpus) alive. name() returns the handle to pass as
+    GenerateContentConfig.cached_content, or None when caching is unavailable so
+    callers fall back to sending the instruction inline. name() never blocks:
+    creating (which loads the corpus) and renewing the cache run in the background,
+    and failed creates back off exponentially up to max_retry_after. `corpus` keeps
+    the corpus text behind the current handle so fallbacks that can't use the cache
+    (inline retries, hedges to another region) can send the same context inline.
+    Note Vertex AI rejects caches below a minimum token count; a system prompt on
+    its own is usually too small, the FAQ corpus is not.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        system_instruction: str,
+        contents_loader: Callable[[], str] | None = None,
+        ttl_seconds: int = 3600,
+        refresh_margin: int = 300,
+        retry_after: int = 300,
+        max_retry_after: int = 6 * 3600,
+        clock: Callable[[], float] = time.time,
+        run_in_background: Callable[[Callable[[], None]], None] = _start_thread,
+    ):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.contents_loader = contents_loader
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.clock = clock
+        self.run_in_background = run_in_background
+        self.corpus = None
+        self._name = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._failures = 0
+        self._updating = False
+        self._lock = threading.Lock()
+
+    @property
+    def includes_corpus(self) -> bool:
+        return self.contents_loader is not None
+
+    def name(self) -> str | None:
+        work = None
+        with self._lock:
+            now = self.clock()
+            if self._name and now >= self._expires_at:
+                self._name = None
+            if not self._updating and now >= self._retry_at:
+                if self._name is None:
+                    work = self._create
+                elif now >= self._expires_at - self.refresh_margin:
+                    work = self._renew
+                self._updating = work is not None
+        if work:
+            self.run_in_background(work)
+        with self._lock:
+            return self._name
+
+    def invalidate(self):
+        """Drop the handle, e.g. after the service reports it missing."""
+        with self._lock:
+            self._name = None
+
+    def refresh(self):
+        """Replace the cache, e.g. after the FAQ table changed. Blocks; call it off the request path."""
+        with self._lock:
+            old_name = self._name
+            self._updating = True
+        self._create()
+        with self._lock:
+            replaced = self._name != old_name
+        if old_name and replaced:
+            try:
+                self.client.caches.delete(name=old_name)
+            except Exception as e:
+                print(f"Error deleting context cache {old_name}: {e}")
+
+    def _expiry(self, cached, now: float) -> float:
+        if getattr(cached, "expire_time", None):
+            return cached.expire_time.timestamp()
+        return now + self.ttl_seconds
+
+    def _create(self):
+        try:
+            corpus = self.contents_loader() if self.contents_loader else None
+            contents = [types.Content(role="user", parts=[types.Part(text=corpus)])] if corpus else None
+            cached = self.client.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name="ads-chatbot-context",
+                    system_instruction=self.system_instruction,
+                    contents=contents,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                backoff = min(self.retry_after * 2 ** (self._failures - 1), self.max_retry_after)
+                self._retry_at = self.clock() + backoff
+                self._updating = False
+            print(f"Error creating context cache, sending context inline for {backoff}s: {e}")
+            return
+        with self._lock:
+            now = self.clock()
+            self._name = cached.name
+            self._expires_at = self._expiry(cached, now)
+            self.corpus = corpus
+            self._failures = 0
+            self._retry_at = 0.0
+            self._updating = False
+
+    def _renew(self):
+        with self._lock:
+            name = self._name
+        try:
+            cached = self.client.caches.update(
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+        except Exception as e:
+            # Keep serving the current handle until it actually expires.
+            print(f"Error renewing context cache {name}: {e}")
+            with self._lock:
+                self._retry_at = self.clock() + self.retry_after
+                self._updating = False
+            return
+        with self._lock:
+            if self._name == name:
+                self._expires_at = self._expiry(cached, self.clock())
+            self._updating = False
+
+
+class UsageTracker:
+    """Accumulates prompt tokens and latency per request, split by cached vs inline context."""
+
+    def __init__(self):
+        self._totals = {
+            mode: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "latency_seconds": 0.0}
+            for mode in ("cached", "inline")
+        }
+        self._lock = threading.Lock()
+
+    def record(self, usage_metadata, latency: float, cached: bool):
+        totals = self._totals["cached" if cached else "inline"]
+        with self._lock:
+            totals["requests"] += 1
+            totals["latency_seconds"] += latency
+            if usage_metadata is not None:
+                totals["prompt_tokens"] += usage_metadata.prompt_token_count or 0
+                totals["cached_tokens"] += usage_metadata.cached_content_token_count or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {}
+            for mode, totals in self._totals.items():
+                requests = totals["requests"] or 1
+                stats[mode] = {
+                    "requests": totals["requests"],
+                    "avg_prompt_tokens": totals["prompt_tokens"] / requests,
+                    # Cached tokens are billed at a discount, so report them separately.
+                    "avg_uncached_prompt_tokens": (totals["prompt_tokens"] - totals["cached_tokens"]) / requests,
+                    "avg_latency_ms": totals["latency_seconds"] / requests * 1000,
+                }
+            return stats
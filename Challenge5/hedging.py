@@ -0,0 +1,173 @@
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FuturesTimeout
+from collections import deque
+from typing import Awaitable, Callable
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies used to pick the hedge delay."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    Token bucket that earns `ratio` of a hedge per request, so hedges can never
+    exceed roughly ratio * requests (plus a small burst) regardless of latency.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class Hedger:
+    """
+    Fires a duplicate request when the primary hasn't answered after the
+    delay_percentile latency of recent calls, returns whichever finishes first
+    and cancels the other. Runs coroutines on one background event loop so
+    async clients keep a single connection pool.
+    """
+
+    def __init__(
+        self,
+        delay_percentile: float = 95,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.05,
+        max_delay: float = 10.0,
+        min_samples: int = 20,
+        budget_ratio: float = 0.05,
+        budget_burst: float = 10.0,
+    ):
+        self.delay_percentile = delay_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(ratio=budget_ratio, burst=budget_burst)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._stats_lock = threading.Lock()
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        delay = self.latencies.percentile(self.delay_percentile)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            }
+
+    def _attempt(self, make_call: Callable[[], Awaitable]) -> asyncio.Task:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        task = asyncio.ensure_future(make_call())
+
+        def on_done(t: asyncio.Task):
+            if not t.cancelled() and t.exception() is None:
+                self.latencies.record(loop.time() - started)
+
+        task.add_done_callback(on_done)
+        return task
+
+    async def call(
+        self,
+        primary: Callable[[], Awaitable],
+        hedge: Callable[[], Awaitable] | None = None,
+        timeout: float | None = None,
+    ):
+        with self._stats_lock:
+            self.requests += 1
+        self.budget.deposit()
+        tasks = []
+        try:
+            return await asyncio.wait_for(self._race(primary, hedge, tasks), timeout)
+        finally:
+            # On timeout or cancellation neither attempt may keep running (or billing).
+            for task in tasks:
+                task.cancel()
+
+    async def _race(self, primary: Callable[[], Awaitable], hedge: Callable[[], Awaitable] | None, tasks: list):
+        first = self._attempt(primary)
+        tasks.append(first)
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay())
+        if done or not self.budget.try_spend():
+            return await first
+
+        with self._stats_lock:
+            self.hedges += 1
+        second = self._attempt(hedge or primary)
+        tasks.append(second)
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((t for t in done if t.exception() is None), None)
+            if winner is not None:
+                if winner is second:
+                    with self._stats_lock:
+                        self.hedge_wins += 1
+                return winner.result()
+        # Both attempts failed: surface the primary's error.
+        return first.result()
+
+    def run(
+        self,
+        primary: Callable[[], Awaitable],
+        hedge: Callable[[], Awaitable] | None = None,
+        timeout: float | None = None,
+    ):
+        """Blocking entry point for request threads; raises TimeoutError after `timeout` seconds."""
+        future = asyncio.run_coroutine_threadsafe(self.call(primary, hedge, timeout), self._get_loop())
+        try:
+            return future.result(timeout + 1.0 if timeout is not None else None)
+        except FuturesTimeout:
+            future.cancel()
+            raise TimeoutError(f"hedged call did not finish within {timeout:.1f}s")
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="hedger-loop", daemon=True).start()
+            return self._loop
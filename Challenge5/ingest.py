@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from html.parser import HTMLParser
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from google import genai
+from google.genai import types
+from pypdf import PdfReader
+
+PROJECT_ID          = os.environ.get("GOOGLE_CLOUD_PROJECT")
+LOCATION            = "us-central1"
+DATASET_ID          = "ads_dataset"
+DOCUMENTS_TABLE_ID  = "documents_embedded"
+EMBEDDING_MODEL_ID  = "text-embedding-005"
+
+SUPPORTED_SUFFIXES  = (".txt", ".md", ".html", ".htm", ".pdf")
+MAX_CHUNK_CHARS     = 1500
+OVERLAP_CHARS       = 200
+EMBED_BATCH_SIZE    = 40     # ~15k tokens at 1500-char chunks, under the 20k per-request limit
+WRITE_BATCH_SIZE    = 500
+EMBED_REQUESTS_PER_MINUTE = 300
+EMBED_ATTEMPTS      = 6
+EMBED_BASE_BACKOFF  = 2.0
+EMBED_MAX_BACKOFF   = 60.0
+
+DOCUMENTS_SCHEMA = [
+    bigquery.SchemaField("question", "STRING"),
+    bigquery.SchemaField("answer", "STRING"),
+    bigquery.SchemaField("content", "STRING"),
+    bigquery.SchemaField("source", "STRING"),
+    bigquery.SchemaField("source_hash", "STRING"),
+    bigquery.SchemaField("chunk_index", "INT64"),
+    bigquery.SchemaField("ml_generate_embedding_result", "FLOAT64", mode="REPEATED"),
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "head"}
+    BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip_depth += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    return "".join(extractor.parts)
+
+
+def iter_sources(paths: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """Yield (path, source) pairs; source is the path relative to the directory given, including its name."""
+    for path in paths:
+        if os.path.isdir(path):
+            base = os.path.dirname(os.path.abspath(path))
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(SUPPORTED_SUFFIXES):
+                        file_path = os.path.join(root, name)
+                        yield file_path, os.path.relpath(os.path.abspath(file_path), base).replace(os.sep, "/")
+        elif path.lower().endswith(SUPPORTED_SUFFIXES):
+            yield path, os.path.basename(path)
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[str]:
+    for path, _ in iter_sources(paths):
+        yield path
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def read_text(path: str) -> str:
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".pdf":
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if suffix in (".html", ".htm"):
+        return html_to_text(text)
+    return text
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    for sentence in _SENTENCE_END.split(text):
+        sentence = _WHITESPACE.sub(" ", sentence).strip()
+        if sentence:
+            yield sentence
+
+
+def chunk_text(text: str, max_chars: int = MAX_CHUNK_CHARS, overlap_chars: int = OVERLAP_CHARS) -> Iterator[str]:
+    """
+    Pack whole sentences into chunks of at most max_chars; each chunk repeats the
+    trailing sentences of the previous one (up to overlap_chars) so answers that
+    straddle a boundary are retrievable from either side.
+    """
+    current = []
+    size = 0
+    for sentence in iter_sentences(text):
+        # A single sentence longer than a chunk gets split hard.
+        while len(sentence) > max_chars:
+            if current:
+                yield " ".join(current)
+                current, size = [], 0
+            yield sentence[:max_chars]
+            sentence = sentence[max_chars - overlap_chars:]
+        if current and size + len(sentence) + 1 > max_chars:
+            yield " ".join(current)
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) + 1 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous) + 1
+            if overlap_size + len(sentence) + 1 > max_chars:
+                overlap, overlap_size = [], 0
+            current, size = overlap, overlap_size
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        yield " ".join(current)
+
+
+def parse_and_chunk(path: str, source: str | None = None) -> tuple[int, list[dict]]:
+    """Worker-process entry point: returns (bytes read, chunk rows) for one file."""
+    source = source or os.path.basename(path)
+    source_hash = file_hash(path)
+    title = os.path.splitext(os.path.basename(source))[0].replace("_", " ").replace("-", " ")
+    rows = []
+    for i, chunk in enumerate(chunk_text(read_text(path))):
+        rows.append({
+            "question": f"{title} (part {i + 1})",
+            "answer": chunk,
+            "content": f"Document: {title} Excerpt: {chunk}",
+            "source": source,
+            "source_hash": source_hash,
+            "chunk_index": i,
+        })
+    return os.path.getsize(path), rows
+
+
+def parse_parallel(sources: Iterable[tuple[str, str]], workers: int, max_inflight: int | None = None) -> Iterator[tuple[int, list[dict]]]:
+    """Parse (path, source) pairs on a process pool, keeping at most max_inflight files buffered."""
+    max_inflight = max_inflight or workers * 2
+    sources = iter(sources)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(parse_and_chunk, *item) for item in islice(sources, max_inflight)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    print(f"Error parsing document: {e}")
+            for item in islice(sources, len(done)):
+                pending.add(pool.submit(parse_and_chunk, *item))
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 60.0):
+        self.capacity = rate
+        self.refill_per_second = rate / per
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.refill_per_second
+            time.sleep(wait_seconds)
+
+
+def call_with_retries(
+    fn: Callable,
+    *args,
+    attempts: int = EMBED_ATTEMPTS,
+    base_backoff: float = EMBED_BASE_BACKOFF,
+    max_backoff: float = EMBED_MAX_BACKOFF,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """Retry with full-jitter exponential backoff, e.g. through 429s from the embedding quota."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = random.uniform(0, min(max_backoff, base_backoff * 2 ** attempt))
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            sleep(delay)
+
+
+def run_pipeline(
+    paths: Iterable[str],
+    embed: Callable[[list[str]], list[list[float]]],
+    write: Callable[[list[dict]], None],
+    workers: int = os.cpu_count() or 1,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    rate_limiter: RateLimiter | None = None,
+    skip: set[tuple[str, str, int]] | None = None,
+    embed_attempts: int = EMBED_ATTEMPTS,
+    embed_backoff: float = EMBED_BASE_BACKOFF,
+) -> dict:
+    """
+    Stream files -> chunks -> embeddings -> table rows. Only the files in flight on
+    the pool, one embedding batch and one write batch are held in memory at a time,
+    so peak memory is independent of corpus size. Chunks whose (source, source_hash,
+    chunk_index) is in `skip` were loaded by an earlier run and are neither embedded
+    nor written, so an interrupted run can simply be started again; an edited file has
+    a new hash and is re-ingested. stats["sources"] maps each source seen to its hash.
+    """
+    skip = skip or set()
+    stats = {"files": 0, "chunks": 0, "skipped": 0, "bytes": 0, "seconds": 0.0, "sources": {}}
+    start = time.perf_counter()
+
+    def chunks() -> Iterator[dict]:
+        for size, rows in parse_parallel(iter_sources(paths), workers):
+            stats["files"] += 1
+            stats["bytes"] += size
+            for row in rows:
+                stats["sources"][row["source"]] = row["source_hash"]
+                if (row["source"], row["source_hash"], row["chunk_index"]) in skip:
+                    stats["skipped"] += 1
+                else:
+                    yield row
+
+    pending_rows = []
+    for batch in batched(chunks(), embed_batch_size):
+        if rate_limiter:
+            rate_limiter.acquire()
+        texts = [row["content"] for row in batch]
+        embeddings = call_with_retries(embed, texts, attempts=embed_attempts, base_backoff=embed_backoff)
+        for row, embedding in zip(batch, embeddings):
+            row["ml_generate_embedding_result"] = embedding
+            pending_rows.append(row)
+        stats["chunks"] += len(batch)
+        if len(pending_rows) >= write_batch_size:
+            write(pending_rows)
+            pending_rows = []
+    if pending_rows:
+        write(pending_rows)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def vertex_embedder(client: genai.Client) -> Callable[[list[str]], list[list[float]]]:
+    def embed(texts: list[str]) -> list[list[float]]:
+        result = client.models.embed_content(
+            model=EMBEDDING_MODEL_ID,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
+        )
+        return [e.values for e in result.embeddings]
+    return embed
+
+
+def bigquery_writer(client: bigquery.Client, table_id: str, replace: bool) -> Callable[[list[dict]], None]:
+    # Batch load jobs rather than streaming inserts: free, and rows are queryable immediately.
+    state = {"first": True}
+
+    def write(rows: list[dict]):
+        disposition = bigquery.WriteDisposition.WRITE_APPEND
+        if replace and state["first"]:
+            disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+        job_config = bigquery.LoadJobConfig(schema=DOCUMENTS_SCHEMA, write_disposition=disposition)
+        client.load_table_from_json(rows, table_id, job_config=job_config).result()
+        state["first"] = False
+        print(f"✓ Wrote {len(rows)} chunks to {table_id}")
+    return write
+
+
+def loaded_chunks(client: bigquery.Client, table_id: str) -> set[tuple[str, str, int]]:
+    try:
+        rows = client.query(f"SELECT DISTINCT source, source_hash, chunk_index FROM `{table_id}`").result()
+    except NotFound:
+        return set()
+    return {(row.source, row.source_hash, row.chunk_index) for row in rows}
+
+
+def stale_sources(loaded: set[tuple[str, str, int]], sources: dict[str, str]) -> dict[str, str]:
+    """Sources ingested in this run whose table rows include chunks from an older version of the file."""
+    return {
+        source: current_hash
+        for source, current_hash in sources.items()
+        if any(loaded_source == source and loaded_hash != current_hash for loaded_source, loaded_hash, _ in loaded)
+    }
+
+
+def delete_stale_chunks(client: bigquery.Client, table_id: str, stale: dict[str, str]):
+    # Runs after the new version is loaded, so an edited document is never missing from retrieval.
+    for source, current_hash in stale.items():
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("source", "STRING", source),
+            bigquery.ScalarQueryParameter("source_hash", "STRING", current_hash),
+        ])
+        query = f"DELETE FROM `{table_id}` WHERE source = @source AND source_hash != @source_hash"
+        client.query(query, job_config=job_config).result()
+        print(f"✓ Removed outdated chunks of {source}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk, embed and load documents into the retrieval table")
+    parser.add_argument("paths", nargs="+", help="files or directories of .txt/.md/.html/.pdf documents")
+    parser.add_argument("--replace", action="store_true", help="truncate the table before the first write (otherwise already loaded chunks are skipped)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--requests-per-minute", type=float, default=EMBED_REQUESTS_PER_MINUTE)
+    args = parser.parse_args()
+
+    try:
+        bq_client = bigquery.Client(project=PROJECT_ID)
+        genai_client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+        table_id = f"{PROJECT_ID}.{DATASET_ID}.{DOCUMENTS_TABLE_ID}"
+        loaded = set() if args.replace else loaded_chunks(bq_client, table_id)
+        if loaded:
+            print(f"✓ Resuming: {len(loaded)} chunks already loaded")
+
+        stats = run_pipeline(
+            args.paths,
+            embed=vertex_embedder(genai_client),
+            write=bigquery_writer(bq_client, table_id, args.replace),
+            workers=args.workers,
+            rate_limiter=RateLimiter(args.requests_per_minute),
+            skip=loaded,
+        )
+        delete_stale_chunks(bq_client, table_id, stale_sources(loaded, stats["sources"]))
+        mb_per_second = stats["bytes"] / 1024 / 1024 / max(stats["seconds"], 1e-9)
+        print(f"✓ Ingested {stats['files']} files into {stats['chunks']} chunks, skipped {stats['skipped']} ({mb_per_second:.2f} MB/s)")
+
+    except Exception as e:
+        print(f"Error ingesting documents: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
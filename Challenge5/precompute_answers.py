@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from google.genai import types
+
+from answer_store import AnswerStore, faq_version, normalize
+from app import (
+    DEGRADED_RESPONSE_PREFIX,
+    EMBEDDING_MODEL_ID,
+    GENERATION_ERROR_RESPONSE,
+    PROJECT_ID,
+    client,
+    generate_response,
+    load_faq_rows,
+    logging_client,
+    search_faqs,
+    validate_input,
+    validate_response,
+)
+
+OUTPUT_PATH     = "artifacts/answer_store.npz"
+CHECKPOINT_PATH = "answer_store.checkpoint.jsonl"
+LOG_NAME        = "ads-chatbot"
+
+
+def mine_paraphrases(known: set[str], top_n: int, max_entries: int) -> list[str]:
+    """Most frequent logged user questions that aren't already FAQ questions."""
+    log_filter = f'logName="projects/{PROJECT_ID}/logs/{LOG_NAME}"'
+    counts = Counter()
+    originals = {}
+    for entry in logging_client.list_entries(filter_=log_filter, page_size=1000, max_results=max_entries):
+        payload = entry.payload if isinstance(entry.payload, dict) else {}
+        query = payload.get("user_query", "")
+        if payload.get("was_filtered") or not validate_input(query)[0]:
+            continue
+        key = normalize(query)
+        if key and key not in known:
+            counts[key] += 1
+            originals.setdefault(key, query)
+    return [originals[key] for key, _ in counts.most_common(top_n)]
+
+
+def load_checkpoint(path: str, version: str) -> dict[str, dict]:
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if record.get("version") == version:
+                done[normalize(record["question"])] = record
+    return done
+
+
+def answer_question(question: str, source: str, version: str) -> dict | None:
+    context = search_faqs(question)
+    response = generate_response(question, context)
+    is_valid, cleaned = validate_response(response)
+    if not is_valid or not context or cleaned == GENERATION_ERROR_RESPONSE or cleaned.startswith(DEGRADED_RESPONSE_PREFIX):
+        return None
+    embedding = client.models.embed_content(
+        model=EMBEDDING_MODEL_ID,
+        contents=[question],
+        config=types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+    ).embeddings[0].values
+    return {"version": version, "question": question, "answer": cleaned, "source": source, "embedding": list(embedding)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute validated answers for FAQ questions and common paraphrases")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--paraphrases", type=int, default=200, help="top-N logged questions to include")
+    parser.add_argument("--max-log-entries", type=int, default=50000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    try:
+        rows = load_faq_rows()
+        version = faq_version(rows)
+        print(f"✓ Loaded {len(rows)} FAQ rows (version {version})")
+
+        questions = [(question, "faq") for question, _ in rows]
+        known = {normalize(question) for question, _ in rows}
+        paraphrases = mine_paraphrases(known, args.paraphrases, args.max_log_entries)
+        questions += [(question, "log") for question in paraphrases]
+        print(f"✓ Mined {len(paraphrases)} paraphrases from logs")
+
+        done = load_checkpoint(args.checkpoint, version)
+        pending = [(q, source) for q, source in questions if normalize(q) not in done]
+        print(f"✓ {len(done)} answers already checkpointed, {len(pending)} to generate")
+
+        failed = 0
+        with open(args.checkpoint, "a") as checkpoint, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = {pool.submit(answer_question, q, source, version): q for q, source in pending}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print(f"Error answering '{futures[future][:50]}': {e}")
+                    record = None
+                if record is None:
+                    failed += 1
+                    continue
+                checkpoint.write(json.dumps(record) + "\n")
+                checkpoint.flush()
+                done[normalize(record["question"])] = record
+
+        records = list(done.values())
+        embeddings = [record.pop("embedding") for record in records]
+        for record in records:
+            record.pop("version")
+        store = AnswerStore(version, records, embeddings)
+        store.save(args.output)
+        print(f"✓ Saved {len(store)} answers to {args.output} ({failed} failed, rerun to resume)")
+
+    except Exception as e:
+        print(f"Error precomputing answers: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
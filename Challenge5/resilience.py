@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from typing import Callable
+
+
+class BackendUnavailable(Exception):
+    pass
+
+
+class DeadlineExceeded(BackendUnavailable):
+    pass
+
+
+class CircuitOpen(BackendUnavailable):
+    pass
+
+
+class Overloaded(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    Opens after failure_threshold consecutive failures, rejects calls for reset_timeout
+    seconds, then lets a single probe through; the probe's outcome closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+
+
+class Backend:
+    """
+    Guards calls to one remote dependency with a deadline, a circuit breaker and
+    jittered retries. Calls run on a small dedicated pool so a hung backend can only
+    tie up its own workers, never the request threads waiting on it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deadline: float,
+        max_workers: int = 8,
+        attempts: int = 2,
+        base_backoff: float = 0.1,
+        max_backoff: float = 1.0,
+        breaker: CircuitBreaker | None = None,
+        jitter: Callable[[float, float], float] = random.uniform,
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.attempts = attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.jitter = jitter
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"backend-{name}")
+
+    def call(self, fn: Callable, *args, **kwargs):
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpen(f"{self.name} circuit is open")
+            future = self._executor.submit(fn, *args, **kwargs)
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FuturesTimeout:
+                future.cancel()
+                self.breaker.record_failure()
+                raise DeadlineExceeded(f"{self.name} did not respond within {self.deadline:.1f}s")
+            except Exception:
+                self.breaker.record_failure()
+                attempt += 1
+                # Full jitter; only retry when the backoff still leaves room in the budget.
+                delay = self.jitter(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                if attempt >= self.attempts or time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+class AdmissionController:
+    """
+    Caps in-flight requests and the number allowed to wait for a slot.
+    Anything beyond that is shed immediately with Overloaded instead of queueing
+    behind slow backends.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self._in_flight >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    raise Overloaded("admission queue is full")
+                self._waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self._in_flight < self.max_concurrent, timeout=self.queue_timeout)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    raise Overloaded("timed out waiting for admission")
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,150 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+MAX_SESSIONS        = 10000
+RECENT_TURNS        = 4
+MAX_TURN_CHARS      = 800
+MAX_SUMMARY_CHARS   = 1200
+MAX_SESSION_CHARS   = 6000
+SESSION_TTL_SECONDS = 1800
+
+FOLLOW_UP_PREFIXES = ("what about", "how about", "and ", "also ", "what if", "what else", "same for")
+FOLLOW_UP_WORDS = {"it", "its", "they", "them", "their", "he", "she"}
+# "this"/"that" also open ordinary questions ("Is that road plowed daily by ADS?"), so they
+# only mark a follow-up in short questions that have little else to go on ("Why is that?")
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+DEMONSTRATIVE_MAX_WORDS = 5
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit - 3].rstrip() + "..."
+
+
+def summarize_turns(summary: str, turns: list[tuple[str, str]]) -> str:
+    """Extractive summary: keep each question and the first sentence of its answer."""
+    lines = [summary] if summary else []
+    for user_msg, bot_msg in turns:
+        first_sentence = _SENTENCE_END.split(bot_msg.strip(), maxsplit=1)[0]
+        lines.append(f"User asked: {_clip(user_msg, 200)} ADS answered: {_clip(first_sentence, 200)}")
+    return "\n".join(lines)
+
+
+class Session:
+    __slots__ = ("summary", "turns", "chars", "updated_at")
+
+    def __init__(self):
+        self.summary = ""
+        self.turns = []
+        self.chars = 0
+        self.updated_at = time.monotonic()
+
+
+class SessionStore:
+    """
+    In-process conversation memory keyed by session id.
+    Sessions are evicted least-recently-used once max_sessions is reached, and each
+    session keeps only its recent turns verbatim; older turns are folded into a
+    bounded summary so the prompt built from a session stays roughly constant in size.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        recent_turns: int = RECENT_TURNS,
+        max_turn_chars: int = MAX_TURN_CHARS,
+        max_summary_chars: int = MAX_SUMMARY_CHARS,
+        max_session_chars: int = MAX_SESSION_CHARS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        summarizer: Callable[[str, list[tuple[str, str]]], str] = summarize_turns,
+    ):
+        self.max_sessions = max_sessions
+        self.recent_turns = recent_turns
+        self.max_turn_chars = max_turn_chars
+        self.max_summary_chars = max_summary_chars
+        self.max_session_chars = max_session_chars
+        self.ttl_seconds = ttl_seconds
+        self.summarizer = summarizer
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _get(self, session_id: str | None) -> tuple[str, Session]:
+        # Ids come straight from request JSON; only ids this store issued are honoured,
+        # anything else (unknown, expired, not a string) gets a fresh server-generated id.
+        now = time.monotonic()
+        session = self._sessions.get(session_id) if isinstance(session_id, str) else None
+        if session is not None and now - session.updated_at > self.ttl_seconds:
+            del self._sessions[session_id]
+            session = None
+        if session is None:
+            session_id = uuid.uuid4().hex
+            session = Session()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.updated_at = now
+        return session_id, session
+
+    def load(self, session_id: str | None) -> tuple[str, str, list[tuple[str, str]]]:
+        """Return (session_id, summary, recent turns), creating the session if needed."""
+        with self._lock:
+            session_id, session = self._get(session_id)
+            return session_id, session.summary, list(session.turns)
+
+    def append_turn(self, session_id: str, user_msg: str, bot_msg: str):
+        user_msg = _clip(user_msg, self.max_turn_chars)
+        bot_msg = _clip(bot_msg, self.max_turn_chars)
+        with self._lock:
+            session_id, session = self._get(session_id)
+            session.turns.append((user_msg, bot_msg))
+            session.chars += len(user_msg) + len(bot_msg)
+            self._compact(session)
+
+    def _compact(self, session: Session):
+        if len(session.turns) <= self.recent_turns and session.chars + len(session.summary) <= self.max_session_chars:
+            return
+        keep = min(self.recent_turns, len(session.turns))
+        old_turns = session.turns[:len(session.turns) - keep]
+        session.turns = session.turns[len(session.turns) - keep:]
+        while session.turns and sum(len(u) + len(b) for u, b in session.turns) > self.max_session_chars - self.max_summary_chars:
+            old_turns.append(session.turns.pop(0))
+        session.chars = sum(len(u) + len(b) for u, b in session.turns)
+        if old_turns:
+            summary = self.summarizer(session.summary, old_turns)
+            # Keep the most recent part of the summary when it outgrows its budget.
+            if len(summary) > self.max_summary_chars:
+                summary = "..." + summary[-(self.max_summary_chars - 3):]
+            session.summary = summary
+
+
+def condense_query(user_query: str, turns: list[tuple[str, str]]) -> str:
+    """
+    Turn a follow-up like "what about Fairbanks?" into a standalone retrieval query
+    by carrying over the previous question. Only questions that open with a follow-up
+    phrase or refer back with a pronoun are rewritten; short standalone questions like
+    "What is SnowLine?" are returned as-is so they still hit precomputed answers.
+    """
+    if not turns:
+        return user_query
+    words = re.findall(r"[a-z']+", user_query.lower())
+    is_follow_up = (
+        user_query.lower().startswith(FOLLOW_UP_PREFIXES)
+        or any(word in FOLLOW_UP_WORDS for word in words)
+        or (len(words) <= DEMONSTRATIVE_MAX_WORDS and any(word in DEMONSTRATIVES for word in words))
+    )
+    if not is_follow_up:
+        return user_query
+    previous_question = turns[-1][0]
+    return _clip(f"{previous_question} {user_query}", 1000)
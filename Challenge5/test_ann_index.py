@@ -0,0 +1,144 @@
+import pytest
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ann_index import IVFIndex, exact_search
+
+
+def clustered_vectors(n: int, dim: int = 32, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def recall(index: IVFIndex, vectors: np.ndarray, queries: np.ndarray, k: int, **search_args) -> float:
+    truth = exact_search(vectors, queries, k)
+    hits = sum(len(set(index.search(q, k, **search_args)[0]) & set(t)) for q, t in zip(queries, truth))
+    return hits / (len(queries) * k)
+
+
+def build(vectors: np.ndarray, nlist: int = 16, pq_subvectors: int = 0) -> IVFIndex:
+    index = IVFIndex(vectors.shape[1], nlist, pq_subvectors)
+    index.train(vectors)
+    index.add(np.arange(len(vectors)), vectors)
+    return index
+
+
+class TestIVFIndex:
+
+    def test_full_probe_matches_exact(self):
+        """Test that probing every list returns the exact top-k"""
+        vectors = clustered_vectors(2000)
+        index = build(vectors)
+        queries = clustered_vectors(20, seed=1)
+        assert recall(index, vectors, queries, 10, fraction_lists_to_search=1.0) == 1.0
+
+    def test_partial_probe_recall(self):
+        """Test that a small probe fraction still finds most true neighbours"""
+        vectors = clustered_vectors(5000)
+        index = build(vectors, nlist=32)
+        queries = clustered_vectors(50, seed=1)
+        assert recall(index, vectors, queries, 10, fraction_lists_to_search=0.25, exact_below=0) >= 0.8
+
+    def test_more_lists_searched_improves_recall(self):
+        """Test that fraction_lists_to_search trades latency for recall"""
+        vectors = clustered_vectors(5000)
+        index = build(vectors, nlist=64)
+        queries = clustered_vectors(50, seed=1)
+        low = recall(index, vectors, queries, 10, nprobe=1, exact_below=0)
+        high = recall(index, vectors, queries, 10, nprobe=16, exact_below=0)
+        assert high > low
+
+    def test_min_lists_to_search(self):
+        """Test that a tiny fraction still probes a minimum number of lists"""
+        vectors = clustered_vectors(8000)
+        index = build(vectors, nlist=64)
+        queries = clustered_vectors(50, seed=1)
+        single = recall(index, vectors, queries, 10, fraction_lists_to_search=0.01, min_lists_to_search=1)
+        floored = recall(index, vectors, queries, 10, fraction_lists_to_search=0.01)
+        assert floored > single
+
+    def test_small_index_searched_exactly(self):
+        """Test that an index below the exact-search size scans every list"""
+        vectors = clustered_vectors(500)
+        index = build(vectors, nlist=22)
+        queries = clustered_vectors(20, seed=1)
+        assert recall(index, vectors, queries, 10, fraction_lists_to_search=0.05) == 1.0
+
+    def test_pq_recall_and_memory(self):
+        """Test that IVF-PQ compresses vectors while keeping reasonable recall"""
+        vectors = clustered_vectors(5000)
+        flat = build(vectors, nlist=16)
+        pq = build(vectors, nlist=16, pq_subvectors=8)
+        queries = clustered_vectors(50, seed=1)
+        assert pq.memory_bytes() < flat.memory_bytes() / 2
+        assert recall(pq, vectors, queries, 10, fraction_lists_to_search=1.0) >= 0.5
+
+    def test_incremental_insert(self):
+        """Test that vectors added after the initial build are searchable"""
+        vectors = clustered_vectors(1000)
+        index = build(vectors)
+        new_vector = clustered_vectors(1, seed=7)
+        index.add([5000], new_vector)
+        ids, scores = index.search(new_vector[0], 1, fraction_lists_to_search=1.0)
+        assert ids[0] == 5000
+        assert scores[0] == pytest.approx(1.0, abs=1e-2)
+        assert len(index) == 1001
+
+    def test_delete_and_compact(self):
+        """Test that deleted ids are never returned, before and after compaction"""
+        vectors = clustered_vectors(1000)
+        index = build(vectors)
+        query = vectors[3]
+        assert index.search(query, 1, fraction_lists_to_search=1.0)[0][0] == 3
+        index.remove([3])
+        assert 3 not in index.search(query, 10, fraction_lists_to_search=1.0)[0]
+        index.compact()
+        assert 3 not in index.search(query, 10, fraction_lists_to_search=1.0)[0]
+        assert len(index) == 999
+
+    def test_remove_unknown_ids_ignored(self):
+        """Test that removing ids that were never added, or twice, does not change the count"""
+        vectors = clustered_vectors(10)
+        index = build(vectors, nlist=2)
+        index.remove([100, 101, 102])
+        assert len(index) == 10
+        index.remove([3, 3])
+        index.remove([3])
+        assert len(index) == 9
+
+    def test_reinsert_deleted_id(self):
+        """Test that a deleted id can be added again with a new vector"""
+        vectors = clustered_vectors(500)
+        index = build(vectors)
+        index.remove([3])
+        index.add([3], vectors[10:11])
+        ids = index.search(vectors[10], 2, fraction_lists_to_search=1.0)[0]
+        assert set(ids) == {3, 10}
+
+    def test_save_and_load(self, tmp_path):
+        """Test that a persisted index returns the same results with its records"""
+        vectors = clustered_vectors(2000)
+        index = build(vectors, pq_subvectors=4)
+        index.remove([0])
+        records = [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(2000)]
+        path = str(tmp_path / "index.npz")
+        index.save(path, records)
+        loaded, loaded_records = IVFIndex.load(path)
+        query = clustered_vectors(1, seed=3)[0]
+        assert list(loaded.search(query, 5)[0]) == list(index.search(query, 5)[0])
+        assert loaded_records[42]["question"] == "Q42"
+        assert 0 not in loaded.search(vectors[0], 10, fraction_lists_to_search=1.0)[0]
+
+    def test_add_requires_training(self):
+        """Test that adding to an untrained index is rejected"""
+        with pytest.raises(RuntimeError):
+            IVFIndex(8, 4).add([0], np.ones((1, 8)))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,62 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from answer_store import AnswerStore, faq_version, normalize
+
+RECORDS = [
+    {"question": "What is the ADS phone number?", "answer": "Call 1-800-SNOW-ADS.", "source": "faq"},
+    {"question": "When was ADS established?", "answer": "ADS was established in 1959.", "source": "faq"},
+]
+EMBEDDINGS = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+
+
+class TestAnswerStore:
+
+    def test_normalize(self):
+        """Test that case, punctuation and spacing are ignored"""
+        assert normalize("  What's the ADS   phone number?? ") == "what s the ads phone number"
+
+    def test_exact_match(self):
+        """Test that a normalized exact match is served without an embedding"""
+        store = AnswerStore("v1", RECORDS)
+        hit = store.lookup("what is the ADS phone number")
+        assert hit["answer"] == "Call 1-800-SNOW-ADS."
+
+    def test_no_match(self):
+        """Test that unknown questions miss without an embedding"""
+        store = AnswerStore("v1", RECORDS, EMBEDDINGS)
+        assert store.lookup("Does ADS clear sidewalks?") is None
+
+    def test_embedding_match(self):
+        """Test that a close paraphrase matches by embedding similarity"""
+        store = AnswerStore("v1", RECORDS, EMBEDDINGS)
+        hit = store.lookup("What year did ADS start?", [0.05, 2.0, 0.0])
+        assert hit["answer"] == "ADS was established in 1959."
+
+    def test_embedding_below_threshold(self):
+        """Test that a distant embedding does not match"""
+        store = AnswerStore("v1", RECORDS, EMBEDDINGS)
+        assert store.lookup("How do I apply for a job?", [1.0, 1.0, 1.0]) is None
+
+    def test_save_and_load(self, tmp_path):
+        """Test that a saved store round-trips with its version"""
+        path = str(tmp_path / "answers.npz")
+        AnswerStore("v1", RECORDS, EMBEDDINGS).save(path)
+        store = AnswerStore.load(path)
+        assert store.version == "v1"
+        assert len(store) == 2
+        assert store.lookup("When was ADS established?", None)["source"] == "faq"
+        assert store.lookup("founded?", [0.0, 1.0, 0.0])["question"] == "When was ADS established?"
+
+    def test_version_tracks_faq_content(self):
+        """Test that the version changes with FAQ content but not row order"""
+        rows = [("Q1", "A1"), ("Q2", "A2")]
+        assert faq_version(rows) == faq_version(list(reversed(rows)))
+        assert faq_version(rows) != faq_version([("Q1", "A1"), ("Q2", "A2 updated")])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
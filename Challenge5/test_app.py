@@ -0,0 +1,227 @@
+import pytest
+import sys
+import os
+import asyncio
+import numpy as np
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from context_cache import ContextCache
+from hedging import Hedger
+from ann_index import IVFIndex
+
+# app.py builds its Google clients at import time; none of them are reached by these tests.
+with mock.patch("google.genai.Client"), mock.patch("google.cloud.logging.Client"), mock.patch("google.cloud.bigquery.Client"):
+    import app
+
+FAQ_CORPUS = "ADS FAQ DATABASE:\n\nQ: When was ADS founded?\nA: ADS was founded in 1959.\n\n"
+
+
+class FakeModels:
+
+    def __init__(self, fail_cached: bool = False, delay: float = 0.0):
+        self.fail_cached = fail_cached
+        self.delay = delay
+        self.calls = []
+
+    def generate_content(self, model, contents, config):
+        self.calls.append((contents, config))
+        if self.fail_cached and config.cached_content:
+            raise RuntimeError("cached content not found")
+        return SimpleNamespace(text="ADS was founded in 1959.", usage_metadata=None)
+
+    async def async_generate_content(self, model, contents, config):
+        self.calls.append((contents, config))
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(text="ADS was founded in 1959.", usage_metadata=None)
+
+
+def fake_client(models: FakeModels) -> SimpleNamespace:
+    caches = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(name="cachedContents/1", expire_time=None))
+    return SimpleNamespace(
+        models=models,
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content=models.async_generate_content)),
+        caches=caches,
+    )
+
+
+@pytest.fixture
+def cached_corpus(monkeypatch):
+    def setup(models: FakeModels):
+        client = fake_client(models)
+        monkeypatch.setattr(app, "client", client)
+        monkeypatch.setattr(app, "context_cache", ContextCache(client, app.MODEL_ID, app.SYSTEM_INSTRUCTION, contents_loader=lambda: FAQ_CORPUS,
+                                                                 run_in_background=lambda work: work()))
+        monkeypatch.setattr(app, "answer_cache", app.TwoTierCache("test:answer"))
+        monkeypatch.setattr(app, "search_faqs", lambda *args, **kwargs: pytest.fail("retrieval should be skipped"))
+    return setup
+
+
+class TestCachedCorpusFallback:
+
+    def test_failed_cached_call_retries_with_corpus_inline(self, cached_corpus):
+        """Test that the inline retry after a failed cached call still carries the FAQ corpus"""
+        models = FakeModels(fail_cached=True)
+        cached_corpus(models)
+        response = app.app.test_client().post("/api/chat", json={"message": "When was ADS founded?"})
+        assert response.status_code == 200
+        assert "1959" in response.get_json()["response"]
+        retry_prompt, retry_config = models.calls[-1]
+        assert retry_config.cached_content is None
+        assert "Q: When was ADS founded?" in retry_prompt
+
+    def test_hedge_sends_corpus_inline(self, cached_corpus, monkeypatch):
+        """Test that a hedge, which can't use the primary's cache, sends the FAQ corpus inline"""
+        primary = FakeModels(delay=1.0)
+        hedge = FakeModels()
+        cached_corpus(primary)
+        monkeypatch.setattr(app, "hedger", Hedger(initial_delay=0.01))
+        monkeypatch.setattr(app, "hedge_client", fake_client(hedge), raising=False)
+        monkeypatch.setattr(app, "HEDGE_MODEL_ID", app.MODEL_ID, raising=False)
+        response = app.app.test_client().post("/api/chat", json={"message": "Who founded ADS?"})
+        assert response.status_code == 200
+        primary_prompt, primary_config = primary.calls[0]
+        hedge_prompt, hedge_config = hedge.calls[0]
+        assert primary_config.cached_content == "cachedContents/1"
+        assert FAQ_CORPUS not in primary_prompt
+        assert FAQ_CORPUS in hedge_prompt
+        assert hedge_config.cached_content is None
+
+
+class TestRetrievalVersion:
+
+    def fake_tables(self, monkeypatch, **modified: datetime) -> dict:
+        tables = {table_id: SimpleNamespace(modified=value) for table_id, value in modified.items()}
+
+        def get_table(table_id, timeout=None):
+            return tables[table_id.rsplit(".", 1)[-1]]
+
+        monkeypatch.setattr(app, "bq_client", SimpleNamespace(get_table=get_table))
+        return tables
+
+    def test_running_instance_switches_namespace(self, monkeypatch):
+        """Test that a table reload moves a running instance's caches to the new version"""
+        monkeypatch.setattr(app, "retrieval_cache", app.TwoTierCache("ads:faqs:old"))
+        monkeypatch.setattr(app, "answer_cache", app.TwoTierCache("ads:answer:old"))
+        monkeypatch.setattr(app, "RETRIEVAL_VERSION", "old")
+        self.fake_tables(monkeypatch, faqs_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        app.retrieval_cache.set("3:plows", [{"question": "Q", "answer": "stale"}])
+        app.check_retrieval_version()
+        assert app.RETRIEVAL_VERSION != "old"
+        assert app.answer_cache.namespace == f"ads:answer:{app.RETRIEVAL_VERSION}"
+        assert app.retrieval_cache.get("3:plows") is None
+
+    def test_cached_corpus_rebuilt_on_change(self, monkeypatch):
+        """Test that a FAQ table change replaces the cached corpus"""
+        corpus = {"text": FAQ_CORPUS}
+        client = fake_client(FakeModels())
+        client.caches.delete = lambda name: None
+        cache = ContextCache(client, app.MODEL_ID, app.SYSTEM_INSTRUCTION, contents_loader=lambda: corpus["text"],
+                             run_in_background=lambda work: work())
+        cache.name()
+        monkeypatch.setattr(app, "context_cache", cache)
+        monkeypatch.setattr(app, "retrieval_cache", app.TwoTierCache("ads:faqs:old"))
+        monkeypatch.setattr(app, "answer_cache", app.TwoTierCache("ads:answer:old"))
+        monkeypatch.setattr(app, "RETRIEVAL_VERSION", "old")
+        self.fake_tables(monkeypatch, faqs_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        corpus["text"] = "ADS FAQ DATABASE:\n\nQ: When was ADS founded?\nA: In 1959.\n\n"
+        app.check_retrieval_version()
+        assert cache.corpus == corpus["text"]
+
+    def test_stale_answer_store_dropped(self, monkeypatch):
+        """Test that precomputed answers stop being served once the FAQ table changes under them"""
+        rows = [("When was ADS founded?", "1959.")]
+        store = SimpleNamespace(version=app.faq_version(rows))
+        monkeypatch.setattr(app, "answer_store", store)
+        monkeypatch.setattr(app, "retrieval_cache", app.TwoTierCache("ads:faqs:old"))
+        monkeypatch.setattr(app, "answer_cache", app.TwoTierCache("ads:answer:old"))
+        monkeypatch.setattr(app, "RETRIEVAL_VERSION", "old")
+        tables = self.fake_tables(monkeypatch, faqs_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        monkeypatch.setattr(app, "load_faq_rows", lambda: rows)
+        app.check_retrieval_version()
+        assert app.answer_store is store
+
+        rows = [("When was ADS founded?", "In 1959.")]
+        tables["faqs_embedded"].modified = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        app.check_retrieval_version()
+        assert app.answer_store is None
+
+    def test_version_follows_faq_table(self, monkeypatch):
+        """Test that reloading the FAQ table moves retrieval and answer caches to a new namespace"""
+        tables = self.fake_tables(monkeypatch, faqs_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        before = app.retrieval_version()
+        assert app.retrieval_version() == before
+        tables["faqs_embedded"].modified = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        assert app.retrieval_version() != before
+
+    def test_version_follows_document_search(self, monkeypatch):
+        """Test that enabling document search, and reloading documents, changes the version"""
+        tables = self.fake_tables(
+            monkeypatch,
+            faqs_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            documents_embedded=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        )
+        faqs_only = app.retrieval_version()
+        monkeypatch.setattr(app, "SEARCH_DOCUMENTS", True)
+        with_documents = app.retrieval_version()
+        assert with_documents != faqs_only
+        tables["documents_embedded"].modified = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        assert app.retrieval_version() != with_documents
+
+
+class TestEmbeddingCache:
+
+    def test_embeddings_cached_as_float32_bytes(self, monkeypatch):
+        """Test that cached query embeddings are packed float32, not lists of Python floats"""
+        calls = []
+
+        def embed_content(model, contents, config):
+            calls.append(contents)
+            return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.5] * 768)])
+
+        cache = app.TwoTierCache("test:emb")
+        monkeypatch.setattr(app, "client", SimpleNamespace(models=SimpleNamespace(embed_content=embed_content)))
+        monkeypatch.setattr(app, "embedding_cache", cache)
+        embedding = app.embed_query("When was ADS founded?")
+        assert embedding.dtype == np.float32
+        assert embedding.shape == (768,)
+        assert np.array_equal(app.embed_query("When was ADS founded?"), embedding)
+        assert len(calls) == 1
+        assert len(cache.get("When was ADS founded?")) == 768 * 4
+
+
+class TestAnnRetrieval:
+
+    def build_index(self, path: str):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((200, 16)).astype(np.float32)
+        records = [
+            {"question": f"Q{i}", "answer": f"A{i}", "table": app.DOCUMENTS_TABLE_ID if i % 2 else app.TABLE_ID}
+            for i in range(200)
+        ]
+        index = IVFIndex(16, 14)
+        index.train(vectors)
+        index.add(np.arange(200), vectors)
+        index.save(path, records)
+        return vectors
+
+    def test_documents_excluded_unless_enabled(self, tmp_path, monkeypatch):
+        """Test that ANN retrieval only returns document chunks when SEARCH_DOCUMENTS is on"""
+        path = str(tmp_path / "ann_index.npz")
+        vectors = self.build_index(path)
+        monkeypatch.setattr(app, "SEARCH_DOCUMENTS", False)
+        index, records = app.load_ann_index(path)
+        ids, _ = index.search(vectors[1], 10)
+        assert len(ids) == 10
+        assert all(records[i]["table"] == app.TABLE_ID for i in ids)
+
+        monkeypatch.setattr(app, "SEARCH_DOCUMENTS", True)
+        index, records = app.load_ann_index(path)
+        assert index.search(vectors[1], 1)[0][0] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
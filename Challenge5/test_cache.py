@@ -0,0 +1,230 @@
+import pytest
+import sys
+import os
+import socket
+import socketserver
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cache import LocalCache, TwoTierCache, connect, decode, encode
+
+
+class FakeRedisServer:
+    """In-memory stand-in speaking enough of the Redis protocol for the cache"""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                    self.wfile.write(server.execute(args))
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, key: bytes) -> bytes | None:
+        item = self.data.get(key)
+        if item is None or (item[1] is not None and time.monotonic() >= item[1]):
+            self.data.pop(key, None)
+            return None
+        return item[0]
+
+    @staticmethod
+    def _bulk(value: bytes | None) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, args: list[bytes]) -> bytes:
+        command = args[0].upper()
+        with self.lock:
+            self.commands.append(command)
+            if command in (b"CLIENT", b"SELECT"):
+                return b"+OK\r\n"
+            if command == b"PING":
+                return b"+PONG\r\n"
+            if command == b"GET":
+                return self._bulk(self._get(args[1]))
+            if command == b"MGET":
+                return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self._get(k)) for k in args[1:])
+            if command == b"DEL":
+                removed = sum(self.data.pop(k, None) is not None for k in args[1:])
+                return b":%d\r\n" % removed
+            if command == b"SET":
+                key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+                if b"NX" in options and self._get(key) is not None:
+                    return b"$-1\r\n"
+                expires_at = None
+                if b"PX" in options:
+                    expires_at = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+                self.data[key] = (value, expires_at)
+                return b"+OK\r\n"
+            return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    yield server
+    server.stop()
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestSerialization:
+
+    def test_round_trip(self):
+        """Test that cached values survive encoding"""
+        value = {"response": "ADS was established in 1959.", "context": [{"question": "Q", "answer": "A"}]}
+        assert decode(encode(value)) == value
+
+    def test_embeddings_are_compact(self):
+        """Test that embeddings are stored as single-precision floats"""
+        embedding = [0.123456789] * 768
+        assert len(encode(embedding)) < 768 * 5 + 8
+        assert decode(encode(embedding))[0] == pytest.approx(0.123456789, rel=1e-6)
+
+
+class TestLocalCache:
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        l1 = LocalCache(max_items=2)
+        l1.set("a", 1, 60)
+        l1.set("b", 2, 60)
+        l1.get("a")
+        l1.set("c", 3, 60)
+        assert l1.get("a") == 1
+        assert l1.get("b") is None
+
+    def test_expiry(self):
+        """Test that expired entries are not returned"""
+        now = [0.0]
+        l1 = LocalCache(clock=lambda: now[0])
+        l1.set("a", 1, 10)
+        now[0] = 11
+        assert l1.get("a") is None
+
+
+class TestTwoTierCache:
+
+    def test_shared_across_instances(self, redis_server):
+        """Test that a value written by one instance is read by another with a cold L1"""
+        first = TwoTierCache("test", connect(redis_server.url))
+        second = TwoTierCache("test", connect(redis_server.url))
+        first.set("faqs:plows", [{"question": "Q", "answer": "A"}])
+        assert second.get("faqs:plows") == [{"question": "Q", "answer": "A"}]
+
+    def test_l1_serves_repeat_reads(self, redis_server):
+        """Test that repeat reads are served from L1 without touching L2"""
+        cache = TwoTierCache("test", connect(redis_server.url))
+        cache.set("key", "value")
+        redis_server.commands.clear()
+        assert cache.get("key") == "value"
+        assert redis_server.commands == []
+
+    def test_get_many_is_one_round_trip(self, redis_server):
+        """Test that L1 misses are fetched with a single MGET"""
+        writer = TwoTierCache("test", connect(redis_server.url))
+        writer.set_many({f"k{i}": i for i in range(10)})
+        reader = TwoTierCache("test", connect(redis_server.url))
+        reader.get("warmup")
+        redis_server.commands.clear()
+        found = reader.get_many([f"k{i}" for i in range(12)])
+        assert found == {f"k{i}": i for i in range(10)}
+        assert redis_server.commands == [b"MGET"]
+
+    def test_stampede_within_instance(self, redis_server):
+        """Test that concurrent misses on one instance compute once"""
+        cache = TwoTierCache("test", connect(redis_server.url))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "answer"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("q", compute))) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == ["answer"] * 10
+        assert len(calls) == 1
+
+    def test_stampede_across_instances(self, redis_server):
+        """Test that concurrent misses on different instances compute once via the L2 lock"""
+        caches = [TwoTierCache("test", connect(redis_server.url)) for _ in range(4)]
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "answer"
+
+        results = []
+        threads = [threading.Thread(target=lambda c=c: results.append(c.get_or_compute("q", compute))) for c in caches]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == ["answer"] * 4
+        assert len(calls) == 1
+
+    def test_uncacheable_results_not_stored(self, redis_server):
+        """Test that results rejected by cache_if are recomputed"""
+        cache = TwoTierCache("test", connect(redis_server.url))
+        assert cache.get_or_compute("q", lambda: [], cache_if=bool) == []
+        assert cache.get_or_compute("q", lambda: ["faq"], cache_if=bool) == ["faq"]
+        assert cache.get("q") == ["faq"]
+
+    def test_degrades_when_l2_down(self):
+        """Test that an unreachable L2 falls back to L1 without raising"""
+        cache = TwoTierCache("test", connect(f"redis://127.0.0.1:{unused_port()}/0"), l2_retry_after=60)
+        start = time.monotonic()
+        assert cache.get_or_compute("q", lambda: "answer") == "answer"
+        assert cache.get("q") == "answer"
+        assert cache.get("missing") is None
+        assert time.monotonic() - start < 1.0
+
+    def test_degrades_when_l2_goes_down(self, redis_server):
+        """Test that losing L2 mid-flight keeps serving from L1"""
+        cache = TwoTierCache("test", connect(redis_server.url))
+        cache.set("key", "value")
+        redis_server.stop()
+        assert cache.get("key") == "value"
+        assert cache.get_or_compute("other", lambda: "computed") == "computed"
+
+    def test_without_l2(self):
+        """Test that the cache works as a plain L1 when no L2 is configured"""
+        cache = TwoTierCache("test", None)
+        assert cache.get_or_compute("q", lambda: "answer") == "answer"
+        assert cache.get("q") == "answer"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
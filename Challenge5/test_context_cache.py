@@ -0,0 +1,183 @@
+import pytest
+import sys
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from context_cache import ContextCache, UsageTracker
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCaches:
+    """Stand-in for client.caches that tracks the cache lifecycle"""
+
+    def __init__(self, clock: FakeClock, fail_create: bool = False, fail_update: bool = False):
+        self.clock = clock
+        self.fail_create = fail_create
+        self.fail_update = fail_update
+        self.create_attempts = 0
+        self.created = []
+        self.updated = []
+        self.deleted = []
+
+    def _cached(self, name: str, ttl: str):
+        expire_time = datetime.fromtimestamp(self.clock() + int(ttl.rstrip("s")), tz=timezone.utc)
+        return SimpleNamespace(name=name, expire_time=expire_time)
+
+    def create(self, model: str, config):
+        self.create_attempts += 1
+        if self.fail_create:
+            raise ValueError("cached content is below the minimum token count")
+        self.created.append(config)
+        return self._cached(f"cachedContents/{len(self.created)}", config.ttl)
+
+    def update(self, name: str, config):
+        if self.fail_update:
+            raise ConnectionError("update failed")
+        self.updated.append(name)
+        return self._cached(name, config.ttl)
+
+    def delete(self, name: str):
+        self.deleted.append(name)
+
+
+def make_cache(clock: FakeClock, **kwargs) -> tuple[ContextCache, FakeCaches]:
+    caches = FakeCaches(clock, **{k: kwargs.pop(k) for k in ("fail_create", "fail_update") if k in kwargs})
+    cache = ContextCache(
+        SimpleNamespace(caches=caches), "gemini-2.0-flash", "You are ADS.",
+        ttl_seconds=3600, refresh_margin=300, retry_after=60, clock=clock,
+        run_in_background=kwargs.pop("run_in_background", lambda work: work()), **kwargs,
+    )
+    return cache, caches
+
+
+class TestContextCache:
+
+    def test_created_once_and_reused(self):
+        """Test that the cache is created lazily and reused while fresh"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock)
+        assert cache.name() == "cachedContents/1"
+        clock.now += 1000
+        assert cache.name() == "cachedContents/1"
+        assert len(caches.created) == 1
+        assert caches.created[0].system_instruction == "You are ADS."
+
+    def test_renewed_before_expiry(self):
+        """Test that the TTL is extended inside the refresh margin"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock)
+        cache.name()
+        clock.now += 3400
+        assert cache.name() == "cachedContents/1"
+        assert caches.updated == ["cachedContents/1"]
+        clock.now += 3000
+        assert cache.name() == "cachedContents/1"
+        assert len(caches.created) == 1
+
+    def test_recreated_after_expiry(self):
+        """Test that an expired cache that could not be renewed is recreated"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock, fail_update=True)
+        cache.name()
+        clock.now += 3400
+        assert cache.name() == "cachedContents/1"
+        clock.now += 300
+        assert cache.name() == "cachedContents/2"
+
+    def test_falls_back_when_unavailable(self):
+        """Test that creation failures return None and are retried only after a backoff"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock, fail_create=True)
+        assert cache.name() is None
+        caches.fail_create = False
+        assert cache.name() is None
+        clock.now += 61
+        assert cache.name() == "cachedContents/1"
+
+    def test_failed_creates_back_off(self):
+        """Test that a cache that keeps failing (e.g. below the minimum size) is retried less and less often"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock, fail_create=True)
+        for _ in range(200):
+            cache.name()
+            clock.now += 10
+        # 2000s of traffic: attempts at 0, 60, 180, 420, 900, 1860s
+        assert caches.create_attempts == 6
+
+    def test_name_does_not_block_on_create(self):
+        """Test that request threads never wait for a slow cache create or corpus load"""
+        release = threading.Event()
+
+        def slow_corpus():
+            release.wait(5)
+            return "Q: When was ADS founded?\nA: 1959."
+
+        cache, caches = make_cache(FakeClock(), contents_loader=slow_corpus,
+                                   run_in_background=lambda work: threading.Thread(target=work, daemon=True).start())
+        start = time.monotonic()
+        assert cache.name() is None
+        assert cache.name() is None
+        assert time.monotonic() - start < 0.5
+        release.set()
+        for _ in range(100):
+            if cache.name():
+                break
+            time.sleep(0.01)
+        assert cache.name() == "cachedContents/1"
+        assert caches.create_attempts == 1
+
+    def test_invalidate(self):
+        """Test that an invalidated handle is replaced on next use"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock)
+        cache.name()
+        cache.invalidate()
+        assert cache.name() == "cachedContents/2"
+
+    def test_corpus_included(self):
+        """Test that the FAQ corpus is cached alongside the system instruction"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock, contents_loader=lambda: "Q: When was ADS founded?\nA: 1959.")
+        assert cache.includes_corpus == True
+        cache.name()
+        assert "1959" in caches.created[0].contents[0].parts[0].text
+        assert "1959" in cache.corpus
+
+    def test_refresh_replaces_and_deletes_old(self):
+        """Test that refresh creates a new cache and deletes the previous one"""
+        clock = FakeClock()
+        cache, caches = make_cache(clock)
+        cache.name()
+        cache.refresh()
+        assert cache.name() == "cachedContents/2"
+        assert caches.deleted == ["cachedContents/1"]
+
+
+class TestUsageTracker:
+
+    def test_split_by_mode(self):
+        """Test that cached and inline requests are tracked separately"""
+        tracker = UsageTracker()
+        tracker.record(SimpleNamespace(prompt_token_count=1200, cached_content_token_count=1000), 0.4, cached=True)
+        tracker.record(SimpleNamespace(prompt_token_count=1200, cached_content_token_count=None), 0.6, cached=False)
+        stats = tracker.stats()
+        assert stats["cached"]["avg_uncached_prompt_tokens"] == 200
+        assert stats["inline"]["avg_uncached_prompt_tokens"] == 1200
+        assert stats["cached"]["avg_latency_ms"] == pytest.approx(400)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
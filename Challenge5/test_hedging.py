@@ -0,0 +1,115 @@
+import pytest
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hedging import HedgeBudget, Hedger, LatencyTracker
+
+
+def delayed(seconds: float, value: str, log: list | None = None):
+    async def call():
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(value)
+            raise
+        return value
+    return call
+
+
+def failing(seconds: float):
+    async def call():
+        await asyncio.sleep(seconds)
+        raise ConnectionError("region unavailable")
+    return call
+
+
+class TestLatencyTracker:
+
+    def test_percentile(self):
+        """Test percentile over recorded samples"""
+        tracker = LatencyTracker()
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        assert tracker.percentile(95) == pytest.approx(0.096)
+
+    def test_empty(self):
+        """Test that an empty tracker has no percentile"""
+        assert LatencyTracker().percentile(95) is None
+
+
+class TestHedgeBudget:
+
+    def test_budget_limits_hedge_rate(self):
+        """Test that hedges are capped at the budget ratio once the burst is spent"""
+        budget = HedgeBudget(ratio=0.1, burst=1.0)
+        spent = 0
+        for _ in range(100):
+            budget.deposit()
+            spent += budget.try_spend()
+        assert spent <= 11
+
+
+class TestHedger:
+
+    def test_fast_primary_not_hedged(self):
+        """Test that a primary finishing before the delay is not hedged"""
+        hedger = Hedger(initial_delay=0.5)
+        result = asyncio.run(hedger.call(delayed(0.01, "primary"), delayed(0.01, "hedge")))
+        assert result == "primary"
+        assert hedger.stats()["hedges"] == 0
+
+    def test_slow_primary_hedged_and_cancelled(self):
+        """Test that a slow primary is hedged and the losing call is cancelled"""
+        hedger = Hedger(initial_delay=0.02)
+        cancelled = []
+        start = time.monotonic()
+        result = asyncio.run(hedger.call(delayed(1.0, "primary", cancelled), delayed(0.01, "hedge")))
+        assert result == "hedge"
+        assert time.monotonic() - start < 0.5
+        assert cancelled == ["primary"]
+        assert hedger.stats()["hedge_wins"] == 1
+
+    def test_no_hedge_without_budget(self):
+        """Test that an exhausted budget disables hedging"""
+        hedger = Hedger(initial_delay=0.01, budget_ratio=0.0, budget_burst=0.0)
+        result = asyncio.run(hedger.call(delayed(0.05, "primary"), delayed(0.0, "hedge")))
+        assert result == "primary"
+        assert hedger.stats()["hedges"] == 0
+
+    def test_failed_hedge_falls_back_to_primary(self):
+        """Test that a failing hedge does not mask a successful primary"""
+        hedger = Hedger(initial_delay=0.01)
+        result = asyncio.run(hedger.call(delayed(0.05, "primary"), failing(0.0)))
+        assert result == "primary"
+
+    def test_delay_follows_observed_latency(self):
+        """Test that the hedge delay tracks the configured latency percentile"""
+        hedger = Hedger(min_samples=10, min_delay=0.0)
+        for ms in range(1, 101):
+            hedger.latencies.record(ms / 1000)
+        assert hedger.hedge_delay() == pytest.approx(0.096)
+
+    def test_run_from_thread(self):
+        """Test the blocking entry point used by request threads"""
+        hedger = Hedger(initial_delay=0.02)
+        assert hedger.run(delayed(0.5, "primary"), delayed(0.01, "hedge")) == "hedge"
+
+    def test_timeout_cancels_both_attempts(self):
+        """Test that a deadline stops the blocking call and cancels primary and hedge"""
+        hedger = Hedger(initial_delay=0.02)
+        cancelled = []
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            hedger.run(delayed(2.0, "primary", cancelled), delayed(2.0, "hedge", cancelled), timeout=0.1)
+        assert time.monotonic() - start < 0.5
+        time.sleep(0.05)
+        assert sorted(cancelled) == ["hedge", "primary"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
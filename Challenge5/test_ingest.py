@@ -0,0 +1,179 @@
+import pytest
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingest import RateLimiter, call_with_retries, chunk_text, html_to_text, iter_files, run_pipeline, stale_sources
+
+
+def fake_embed(texts: list[str]) -> list[list[float]]:
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+class TestChunking:
+
+    def test_short_text_single_chunk(self):
+        """Test that short text stays in one chunk"""
+        assert list(chunk_text("ADS plows roads. It was founded in 1959.")) == ["ADS plows roads. It was founded in 1959."]
+
+    def test_chunks_respect_max_size(self):
+        """Test that chunks never exceed the size limit"""
+        text = " ".join(f"Sentence number {i} about snow removal." for i in range(500))
+        chunks = list(chunk_text(text, max_chars=300, overlap_chars=80))
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 300 for chunk in chunks)
+
+    def test_chunks_split_on_sentences_with_overlap(self):
+        """Test that chunks end on sentence boundaries and repeat the previous tail"""
+        text = " ".join(f"Sentence number {i} about snow removal." for i in range(50))
+        chunks = list(chunk_text(text, max_chars=300, overlap_chars=80))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert previous.endswith(".")
+            last_sentence = previous.rsplit(". ", 1)[-1]
+            assert last_sentence in chunk
+            assert chunk.index(last_sentence) < 80
+
+    def test_long_sentence_split_hard(self):
+        """Test that a sentence longer than a chunk is split"""
+        chunks = list(chunk_text("x" * 1000, max_chars=300, overlap_chars=50))
+        assert all(len(chunk) <= 300 for chunk in chunks)
+        assert len(chunks) == 4
+
+
+class TestParsing:
+
+    def test_html_to_text(self):
+        """Test that scripts and styles are dropped and blocks become paragraphs"""
+        html = "<html><head><title>t</title></head><body><script>var x;</script><p>Plows run at night.</p><p>Call us.</p></body></html>"
+        text = html_to_text(html)
+        assert "var x" not in text
+        assert "Plows run at night." in text
+        assert "\n\n" in text
+
+    def test_iter_files_filters_suffixes(self, tmp_path):
+        """Test that only supported document types are picked up"""
+        (tmp_path / "guide.txt").write_text("a")
+        (tmp_path / "page.html").write_text("b")
+        (tmp_path / "image.png").write_bytes(b"c")
+        names = sorted(os.path.basename(p) for p in iter_files([str(tmp_path)]))
+        assert names == ["guide.txt", "page.html"]
+
+
+class TestPipeline:
+
+    def test_pipeline_embeds_and_writes_in_batches(self, tmp_path):
+        """Test the end-to-end pipeline with a fake embedder and writer"""
+        for i in range(5):
+            (tmp_path / f"bulletin-{i}.txt").write_text(" ".join(f"Road {i} update {j}." for j in range(200)))
+        embed_calls = []
+        writes = []
+
+        def embed(texts):
+            embed_calls.append(len(texts))
+            return fake_embed(texts)
+
+        stats = run_pipeline([str(tmp_path)], embed, writes.append, workers=2, embed_batch_size=8, write_batch_size=20)
+        rows = [row for batch in writes for row in batch]
+        assert stats["files"] == 5
+        assert stats["chunks"] == len(rows)
+        assert max(embed_calls) <= 8
+        assert all(len(batch) <= 20 + 8 for batch in writes)
+        assert all(len(row["ml_generate_embedding_result"]) == 2 for row in rows)
+        assert {row["source"] for row in rows} == {f"{tmp_path.name}/bulletin-{i}.txt" for i in range(5)}
+
+    def test_rerun_skips_loaded_chunks(self, tmp_path):
+        """Test that a rerun after a failure only embeds and writes the chunks that are missing"""
+        for i in range(3):
+            (tmp_path / f"bulletin-{i}.txt").write_text(" ".join(f"Road {i} update {j}." for j in range(200)))
+        calls = {"count": 0}
+
+        def embed_then_fail(texts):
+            calls["count"] += 1
+            if calls["count"] > 2:
+                raise ConnectionError("429 quota exceeded")
+            return fake_embed(texts)
+
+        first_run = []
+        with pytest.raises(ConnectionError):
+            run_pipeline([str(tmp_path)], embed_then_fail, first_run.append, workers=1,
+                         embed_batch_size=4, write_batch_size=4, embed_attempts=1)
+        loaded = {(row["source"], row["source_hash"], row["chunk_index"]) for batch in first_run for row in batch}
+        assert loaded
+
+        second_run = []
+        stats = run_pipeline([str(tmp_path)], fake_embed, second_run.append, workers=1, skip=loaded)
+        rewritten = {(row["source"], row["source_hash"], row["chunk_index"]) for batch in second_run for row in batch}
+        assert stats["skipped"] == len(loaded)
+        assert not rewritten & loaded
+        full_run = []
+        run_pipeline([str(tmp_path)], fake_embed, full_run.append, workers=1)
+        assert rewritten | loaded == {(row["source"], row["source_hash"], row["chunk_index"]) for batch in full_run for row in batch}
+
+    def test_same_name_in_different_folders_kept_apart(self, tmp_path):
+        """Test that files sharing a name in different subfolders are separate sources on resume"""
+        (tmp_path / "2024").mkdir()
+        (tmp_path / "2024" / "bulletin.txt").write_text("Plows run nightly in 2024.")
+        first_run = []
+        run_pipeline([str(tmp_path)], fake_embed, first_run.append, workers=1)
+        loaded = {(row["source"], row["source_hash"], row["chunk_index"]) for batch in first_run for row in batch}
+
+        (tmp_path / "2025").mkdir()
+        (tmp_path / "2025" / "bulletin.txt").write_text("Plows run twice nightly in 2025.")
+        second_run = []
+        stats = run_pipeline([str(tmp_path)], fake_embed, second_run.append, workers=1, skip=loaded)
+        assert stats["skipped"] == 1
+        assert [row["source"] for batch in second_run for row in batch] == [f"{tmp_path.name}/2025/bulletin.txt"]
+
+    def test_edited_file_reingested_and_old_chunks_marked_stale(self, tmp_path):
+        """Test that an edited file is not skipped and its previous chunks are flagged for deletion"""
+        path = tmp_path / "bulletin.txt"
+        path.write_text("Plows run nightly.")
+        first_run = []
+        run_pipeline([str(tmp_path)], fake_embed, first_run.append, workers=1)
+        loaded = {(row["source"], row["source_hash"], row["chunk_index"]) for batch in first_run for row in batch}
+
+        path.write_text("Plows run twice nightly.")
+        second_run = []
+        stats = run_pipeline([str(tmp_path)], fake_embed, second_run.append, workers=1, skip=loaded)
+        assert stats["skipped"] == 0
+        assert "twice" in second_run[0][0]["answer"]
+        source = f"{tmp_path.name}/bulletin.txt"
+        assert stale_sources(loaded, stats["sources"]) == {source: second_run[0][0]["source_hash"]}
+        assert stale_sources(loaded, {}) == {}
+
+    def test_embedding_retried_with_backoff(self):
+        """Test that transient embedding errors are retried with growing delays"""
+        delays = []
+        failures = [ConnectionError("429"), ConnectionError("429")]
+
+        def embed(texts):
+            if failures:
+                raise failures.pop()
+            return fake_embed(texts)
+
+        result = call_with_retries(embed, ["a"], attempts=3, base_backoff=1.0, sleep=delays.append)
+        assert result == [[1.0, 1.0]]
+        assert len(delays) == 2
+        assert all(0 <= delay <= 4.0 for delay in delays)
+
+    def test_embedding_gives_up_after_attempts(self):
+        """Test that a persistent embedding error is raised once attempts run out"""
+        def embed(texts):
+            raise ConnectionError("429")
+
+        with pytest.raises(ConnectionError):
+            call_with_retries(embed, ["a"], attempts=3, sleep=lambda delay: None)
+
+    def test_rate_limiter(self):
+        """Test that calls beyond the burst are spaced out"""
+        limiter = RateLimiter(rate=5, per=0.5)
+        start = time.monotonic()
+        for _ in range(7):
+            limiter.acquire()
+        assert time.monotonic() - start >= 0.15
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
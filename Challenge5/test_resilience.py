@@ -0,0 +1,184 @@
+import pytest
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from resilience import (
+    AdmissionController,
+    Backend,
+    CircuitBreaker,
+    CircuitOpen,
+    DeadlineExceeded,
+    Overloaded,
+)
+
+
+class FlakyBackend:
+    """Fault-injecting stand-in for BigQuery / Vertex AI"""
+
+    def __init__(self, latency: float = 0.0, fail_times: int = 0):
+        self.latency = latency
+        self.fail_times = fail_times
+        self.calls = 0
+
+    def __call__(self, query: str) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.calls <= self.fail_times:
+            raise ConnectionError("backend unavailable")
+        return f"answer to {query}"
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold(self):
+        """Test that consecutive failures trip the breaker"""
+        breaker = CircuitBreaker(failure_threshold=3)
+        for _ in range(3):
+            assert breaker.allow() == True
+            breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow() == False
+
+    def test_half_open_probe_closes(self):
+        """Test that a successful probe after the reset timeout closes the breaker"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 11
+        assert breaker.allow() == True
+        assert breaker.allow() == False
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_probe_failure_reopens(self):
+        """Test that a failed probe re-opens the breaker"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 11
+        assert breaker.allow() == True
+        breaker.record_failure()
+        assert breaker.allow() == False
+
+
+class TestBackend:
+
+    def test_healthy_call(self):
+        """Test that a healthy backend result is returned"""
+        backend = Backend("stub", deadline=1.0)
+        assert backend.call(FlakyBackend(), "plows") == "answer to plows"
+
+    def test_deadline_bounds_latency(self):
+        """Test that a browned-out backend fails within its deadline"""
+        backend = Backend("stub", deadline=0.1)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            backend.call(FlakyBackend(latency=2.0), "plows")
+        assert time.monotonic() - start < 0.5
+
+    def test_retry_recovers_transient_failure(self):
+        """Test that a single transient failure is retried"""
+        stub = FlakyBackend(fail_times=1)
+        backend = Backend("stub", deadline=2.0, attempts=2, base_backoff=0.01)
+        assert backend.call(stub, "plows") == "answer to plows"
+        assert stub.calls == 2
+
+    def test_no_retry_without_budget(self):
+        """Test that retries are skipped when the backoff would exceed the deadline"""
+        stub = FlakyBackend(fail_times=1)
+        backend = Backend("stub", deadline=0.05, attempts=3, base_backoff=10, max_backoff=10, jitter=lambda low, high: high)
+        with pytest.raises(ConnectionError):
+            backend.call(stub, "plows")
+        assert stub.calls == 1
+
+    def test_open_circuit_fails_fast(self):
+        """Test that latency stays bounded once the breaker trips during a brownout"""
+        backend = Backend("stub", deadline=0.05, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        slow = FlakyBackend(latency=1.0)
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                backend.call(slow, "plows")
+        start = time.monotonic()
+        with pytest.raises(CircuitOpen):
+            backend.call(slow, "plows")
+        assert time.monotonic() - start < 0.01
+
+
+class TestAdmissionController:
+
+    def test_sheds_beyond_queue(self):
+        """Test that requests beyond concurrency plus queue are shed immediately"""
+        admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1.0)
+        admission.acquire()
+        start = time.monotonic()
+        with pytest.raises(Overloaded):
+            admission.acquire()
+        assert time.monotonic() - start < 0.1
+        admission.release()
+        admission.acquire()
+        admission.release()
+
+    def test_queued_request_times_out(self):
+        """Test that a queued request gives up after the queue timeout"""
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        admission.acquire()
+        with pytest.raises(Overloaded):
+            admission.acquire()
+
+    def test_queued_request_admitted_on_release(self):
+        """Test that a waiting request is admitted when a slot frees up"""
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1.0)
+        admission.acquire()
+        threading.Timer(0.05, admission.release).start()
+        with admission.admit():
+            pass
+
+    def test_bounded_latency_under_brownout(self):
+        """Test end-to-end: a burst against a hung backend is either shed or fails by the deadline"""
+        admission = AdmissionController(max_concurrent=4, max_queue=2, queue_timeout=0.2)
+        backend = Backend("stub", deadline=0.2, breaker=CircuitBreaker(failure_threshold=100))
+        hung = FlakyBackend(latency=5.0)
+        outcomes = []
+        latencies = []
+        lock = threading.Lock()
+
+        def request():
+            start = time.monotonic()
+            try:
+                with admission.admit():
+                    backend.call(hung, "plows")
+                outcome = "ok"
+            except Overloaded:
+                outcome = "shed"
+            except DeadlineExceeded:
+                outcome = "deadline"
+            with lock:
+                outcomes.append(outcome)
+                latencies.append(time.monotonic() - start)
+
+        threads = [threading.Thread(target=request) for _ in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert "shed" in outcomes
+        assert "deadline" in outcomes
+        assert max(latencies) < 1.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
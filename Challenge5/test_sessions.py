@@ -0,0 +1,119 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sessions import SessionStore, condense_query
+
+
+class TestSessionStore:
+
+    def test_new_session_gets_id(self):
+        """Test that a missing session id creates a fresh session"""
+        store = SessionStore()
+        session_id, summary, history = store.load(None)
+        assert session_id
+        assert summary == ""
+        assert history == []
+
+    def test_turns_are_remembered(self):
+        """Test that turns appended to a session are returned on the next load"""
+        store = SessionStore()
+        session_id, _, _ = store.load(None)
+        store.append_turn(session_id, "When does ADS plow Anchorage?", "Primary routes are cleared first.")
+        _, _, history = store.load(session_id)
+        assert history == [("When does ADS plow Anchorage?", "Primary routes are cleared first.")]
+
+    def test_lru_eviction(self):
+        """Test that the least recently used session is evicted at capacity"""
+        store = SessionStore(max_sessions=2)
+        first, _, _ = store.load("first")
+        second, _, _ = store.load("second")
+        store.load(first)
+        store.load("third")
+        assert len(store) == 2
+        _, _, history = store.load(second)
+        assert history == []
+        assert len(store) == 2
+
+    def test_old_turns_compacted_into_summary(self):
+        """Test that only recent turns stay verbatim and older ones are summarized"""
+        store = SessionStore(recent_turns=2)
+        session_id, _, _ = store.load(None)
+        for i in range(5):
+            store.append_turn(session_id, f"Question {i}?", f"Answer {i}. More detail.")
+        _, summary, history = store.load(session_id)
+        assert len(history) == 2
+        assert history[-1][0] == "Question 4?"
+        assert "Question 0?" in summary
+        assert "More detail" not in summary
+
+    def test_history_size_stays_bounded(self):
+        """Test that history sent to the prompt stops growing with conversation length"""
+        store = SessionStore(recent_turns=3, max_summary_chars=500, max_session_chars=2000)
+        session_id, _, _ = store.load(None)
+        for i in range(200):
+            store.append_turn(session_id, f"Question {i}?" * 20, "Answer. " * 100)
+        _, summary, history = store.load(session_id)
+        assert len(summary) <= 500
+        assert len(summary) + sum(len(u) + len(b) for u, b in history) <= 2000
+
+    def test_expired_session_is_reset(self):
+        """Test that idle sessions past their TTL start over"""
+        store = SessionStore(ttl_seconds=0)
+        session_id, _, _ = store.load(None)
+        store.append_turn(session_id, "Question?", "Answer.")
+        _, _, history = store.load(session_id)
+        assert history == []
+
+    def test_unknown_session_id_replaced(self):
+        """Test that a client cannot choose its own session id"""
+        store = SessionStore()
+        session_id, _, _ = store.load("chosen-by-client")
+        assert session_id != "chosen-by-client"
+        assert store.load(session_id)[0] == session_id
+
+    def test_non_string_session_id_gets_fresh_id(self):
+        """Test that a malformed session id from the client starts a new session"""
+        store = SessionStore()
+        for bad_id in (123, ["abc"], {"id": "abc"}):
+            session_id, _, history = store.load(bad_id)
+            assert isinstance(session_id, str)
+            assert history == []
+
+
+class TestCondenseQuery:
+
+    def test_no_history_unchanged(self):
+        """Test that the first question is used as-is"""
+        assert condense_query("What about Fairbanks?", []) == "What about Fairbanks?"
+
+    def test_follow_up_carries_previous_question(self):
+        """Test that a follow-up is expanded with the previous question"""
+        history = [("When does ADS plow Anchorage roads?", "Primary routes first.")]
+        query = condense_query("What about Fairbanks?", history)
+        assert "Anchorage roads" in query
+        assert "Fairbanks" in query
+
+    def test_standalone_question_unchanged(self):
+        """Test that a self-contained question is not rewritten"""
+        history = [("When does ADS plow Anchorage roads?", "Primary routes first.")]
+        query = "How do I apply for a snowplow driver job at ADS?"
+        assert condense_query(query, history) == query
+
+    def test_short_standalone_question_unchanged(self):
+        """Test that short questions without a pronoun or follow-up phrase are not rewritten"""
+        history = [("When does ADS plow Anchorage roads?", "Primary routes first.")]
+        for query in ("What is SnowLine?", "Why does ADS salt roads?", "Road closures?", "Is there a fee for driveway plowing?",
+                      "Is that road on the priority plowing list?"):
+            assert condense_query(query, history) == query
+
+    def test_pronoun_follow_up_carries_previous_question(self):
+        """Test that a question referring back with a pronoun is expanded"""
+        history = [("When does ADS plow Anchorage roads?", "Primary routes first.")]
+        assert "Anchorage" in condense_query("Why is that?", history)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])